@@ -5,11 +5,20 @@ from flask_login import LoginManager
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config_object='app.config.Config'):
     app = Flask(__name__, static_folder='../static')
-    app.config.from_object('app.config.Config')
+    app.config.from_object(config_object)
 
-    db.init_app(app)
+    from app import database
+    database.init_app(app)
+    from app.controllers import http_client
+    http_client.init_app(app)
+    from app.controllers import metrics
+    metrics.init_app(app)
+    from app.controllers import snapshots
+    snapshots.init_app(app)
+    from app.controllers import render_cache
+    render_cache.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = ''
@@ -17,20 +26,23 @@ def create_app():
     with app.app_context():
         # Импортируем модели для регистрации в SQLAlchemy
         from . import models
-        db.create_all()
-
-        # Создаём администратора, если он не существует
-        from werkzeug.security import generate_password_hash
-        from .models import User, Product
-        if not User.query.filter_by(username='admin').first():
-            admin_user = User(
-                username='admin',
-                password=generate_password_hash('admin'),
-                role='admin'
-            )
-            db.session.add(admin_user)
-            db.session.commit()
-            db.session.commit()
+        from .migrations import upgrade
+        with database.schema_lock():
+            db.create_all()
+            upgrade()
+
+            # Создаём администратора, если он не существует
+            from werkzeug.security import generate_password_hash
+            from .models import User, Product
+            if not User.query.filter_by(username='admin').first():
+                admin_user = User(
+                    username='admin',
+                    password=generate_password_hash('admin'),
+                    role='admin'
+                )
+                db.session.add(admin_user)
+                db.session.commit()
+                db.session.commit()
 
     from app.routes.auth import auth_bp
     from app.routes.dashboard import dashboard_bp
@@ -38,6 +50,9 @@ def create_app():
     from app.routes.settings import settings_bp
     from app.routes.update import update_bp
     from app.routes.profile import profile_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.notifications import notifications_bp
+    from app.routes.api import api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
@@ -45,5 +60,11 @@ def create_app():
     app.register_blueprint(settings_bp)
     app.register_blueprint(update_bp)
     app.register_blueprint(profile_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(notifications_bp)
+    app.register_blueprint(api_bp)
+
+    from app.cli import vercheck_cli
+    app.cli.add_command(vercheck_cli)
 
     return app
@@ -0,0 +1,206 @@
+import json
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from . import db
+from .models import User
+from .controllers import audit_export, jobs, metrics, render_cache, snapshots
+from .controllers.audit_import import ImportFormatError, read_inventory, import_inventory
+from .controllers.notifications import recount_unread
+from .controllers.sources import SOURCES
+
+# Коды завершения для cron и CI: 0 — успех, 1 — ошибка, 3 — часть источников не обновлена,
+# 75 — обновление уже выполняется другим процессом (EX_TEMPFAIL, можно повторить позже)
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_PARTIAL = 3
+EXIT_BUSY = 75
+
+EXPORT_FORMATS = ('csv', 'html', 'xlsx')
+
+vercheck_cli = AppGroup('vercheck', help='Служебные команды VerCheck. Коды завершения: 0 — успех, 1 — ошибка, '
+                                         '3 — часть источников не обновлена, 75 — обновление уже идёт.')
+
+json_option = click.option('--json', 'as_json', is_flag=True, help='Вывести результат в JSON.')
+
+
+def _emit(as_json, payload, text):
+    click.echo(json.dumps(payload, ensure_ascii=False, default=str) if as_json else text)
+
+
+def _fail(as_json, message, code=EXIT_ERROR):
+    if as_json:
+        click.echo(json.dumps({'error': message}, ensure_ascii=False))
+    else:
+        click.echo(f'Ошибка: {message}', err=True)
+    click.get_current_context().exit(code)
+
+
+def _user_id(username, as_json):
+    user_id = db.session.query(User.id).filter_by(username=username).scalar()
+    if user_id is None:
+        _fail(as_json, f'Пользователь {username} не найден.')
+    return user_id
+
+
+@vercheck_cli.command('refresh')
+@click.option('--source', 'keys', multiple=True, type=click.Choice(list(SOURCES)),
+              help='Источник (можно несколько; по умолчанию все).')
+@click.option('--parallel', type=click.IntRange(min=1), default=None,
+              help='Число одновременно опрашиваемых источников (по умолчанию REFRESH_MAX_WORKERS).')
+@json_option
+def refresh_command(keys, parallel, as_json):
+    """Обновление версий из источников вне веб-сервера."""
+    run = jobs.begin_refresh(current_app, keys, trigger='cli')
+    if run is None:
+        _fail(as_json, 'Обновление уже выполняется.', EXIT_BUSY)
+    try:
+        run, outcomes = jobs.run_refresh_job(keys or None, 'cli', run, max_workers=parallel, lock=jobs.REFRESH_LOCK)
+    except BaseException:
+        db.session.rollback()
+        jobs.release_lease(jobs.REFRESH_LOCK)
+        raise
+    finally:
+        metrics.registry.flush()
+    _emit(as_json, {
+        'run_id': run.id,
+        'status': run.status,
+        'duration': run.duration,
+        'sources': [outcome.as_dict() for outcome in outcomes],
+    }, '\n'.join([f'{outcome.title}: {outcome.message}' for outcome in outcomes] +
+                 [f'Итог: {run.status}, {run.duration:.1f} с']))
+    if run.status == 'error':
+        click.get_current_context().exit(EXIT_ERROR)
+    if run.status == 'partial':
+        click.get_current_context().exit(EXIT_PARTIAL)
+
+
+@vercheck_cli.command('import-audit')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', default='admin', show_default=True, help='Владелец записей аудита.')
+@click.option('--batch-size', type=int, default=None, help='Размер пачки вставки.')
+@json_option
+def import_audit_command(path, username, batch_size, as_json):
+    """Массовый импорт аудита из CSV/XLSX (продукт; версия)."""
+    user_id = _user_id(username, as_json)
+    with open(path, 'rb') as stream:
+        try:
+            rows = read_inventory(stream, path)
+            result = import_inventory(user_id, rows, batch_size or current_app.config['AUDIT_IMPORT_BATCH_SIZE'])
+        except ImportFormatError as e:
+            _fail(as_json, str(e))
+    text = (f'Импортировано: {result.imported}, устарели: {result.outdated}, актуальны: {result.current}, '
+            f'версия не распознана: {result.unknown_version}, пропущено: {result.skipped}')
+    if result.unmatched:
+        text += '\nНе найдены продукты: ' + ', '.join(result.unmatched)
+    _emit(as_json, result.as_dict(), text)
+
+
+@vercheck_cli.command('export-audit')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--user', 'username', default='admin', show_default=True, help='Владелец записей аудита.')
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default=None,
+              help='Формат выгрузки (по умолчанию — по расширению файла).')
+@json_option
+def export_audit_command(path, username, export_format, as_json):
+    """Выгрузка аудита пользователя в файл CSV, HTML или XLSX."""
+    export_format = export_format or path.rsplit('.', 1)[-1].lower()
+    if export_format not in EXPORT_FORMATS:
+        _fail(as_json, f'Неизвестный формат выгрузки: {export_format}.')
+    user_id = _user_id(username, as_json)
+    exported = {'rows': 0}
+
+    def counted(rows):
+        for row in rows:
+            exported['rows'] += 1
+            yield row
+
+    rows = counted(audit_export.export_rows(user_id, current_app.config['AUDIT_EXPORT_CHUNK_SIZE']))
+    if export_format == 'xlsx':
+        with open(path, 'wb') as output:
+            audit_export.write_xlsx(rows, output)
+    else:
+        # Шаблон HTML строит ссылки через url_for, которому нужен контекст запроса
+        with current_app.test_request_context(), open(path, 'w', encoding='utf-8', newline='') as output:
+            chunks = audit_export.csv_chunks(rows) if export_format == 'csv' else audit_export.html_chunks(rows)
+            for chunk in chunks:
+                output.write(chunk)
+    _emit(as_json, {'path': path, 'format': export_format, 'rows': exported['rows']},
+          f'Выгружено записей: {exported["rows"]} в {path}')
+
+
+@vercheck_cli.command('recount-unread')
+@json_option
+def recount_unread_command(as_json):
+    """Пересчёт счётчиков непрочитанных уведомлений по таблице уведомлений."""
+    users = recount_unread()
+    db.session.commit()
+    _emit(as_json, {'users': users}, f'Пересчитано пользователей: {users}')
+
+
+@vercheck_cli.command('backfill-version-keys')
+@json_option
+def backfill_version_keys_command(as_json):
+    """Заполнение пустых сортируемых ключей версий (после ручной правки базы)."""
+    from .migrations import backfill_version_keys
+    with db.engine.begin() as connection:
+        backfill_version_keys(connection)
+    _emit(as_json, {'status': 'ok'}, 'Ключи версий заполнены.')
+
+
+@vercheck_cli.command('clear-render-cache')
+@json_option
+def clear_render_cache_command(as_json):
+    """Очистка кэша отрисованных таблиц дашборда и аудита."""
+    removed = render_cache.store().clear()
+    _emit(as_json, {'removed': removed}, f'Удалено фрагментов: {removed}')
+
+
+@vercheck_cli.command('replay-snapshots')
+@click.option('--source', 'keys', multiple=True, type=click.Choice(list(SOURCES)),
+              help='Источник (можно несколько; по умолчанию все).')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Только снимки, полученные с этой даты.')
+@click.option('--workers', type=int, default=None, help='Число процессов разбора (по умолчанию — число CPU).')
+@json_option
+def replay_snapshots_command(keys, since, workers, as_json):
+    """Повторное извлечение версий из архива страниц без обращения к сайтам."""
+    result = snapshots.replay(current_app.config['SNAPSHOT_DIR'], keys, since, workers,
+                              current_app.config['HTML_PARSER'])
+    text = (f'Снимков разобрано: {result.snapshots - len(result.failed)}, ошибок: {len(result.failed)}, '
+            f'добавлено продуктов: {result.products_added}, версий: {result.versions_added}, '
+            f'пропущено версий новее последней: {result.versions_skipped}')
+    for key, digest, message in result.failed:
+        text += f'\n{key} {digest}: {message}'
+    _emit(as_json, {
+        'snapshots': result.snapshots,
+        'failed': [{'source': key, 'digest': digest, 'error': message} for key, digest, message in result.failed],
+        'products_added': result.products_added,
+        'versions_added': result.versions_added,
+        'versions_skipped': result.versions_skipped,
+    }, text)
+    if result.failed:
+        click.get_current_context().exit(EXIT_PARTIAL)
+
+
+@vercheck_cli.command('prune-snapshots')
+@click.option('--days', type=int, default=None, help='Срок хранения в днях (по умолчанию SNAPSHOT_RETENTION_DAYS).')
+@click.option('--keep', type=int, default=None,
+              help='Сколько последних снимков источника хранить всегда (по умолчанию SNAPSHOT_KEEP_LATEST).')
+@json_option
+def prune_snapshots_command(days, keep, as_json):
+    """Удаление устаревших снимков страниц из архива."""
+    config = current_app.config
+    rows, files = snapshots.prune(config['SNAPSHOT_DIR'],
+                                  config['SNAPSHOT_RETENTION_DAYS'] if days is None else days,
+                                  config['SNAPSHOT_KEEP_LATEST'] if keep is None else keep)
+    _emit(as_json, {'rows': rows, 'files': files}, f'Удалено записей: {rows}, файлов: {files}')
+
+
+def main():
+    # Точка входа без веб-сервера и планировщика (см. vercheck.py): приложение создаётся только
+    # ради конфигурации и БД, команды выполняются в его контексте
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        vercheck_cli.main(prog_name='vercheck')
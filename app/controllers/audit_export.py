@@ -0,0 +1,72 @@
+import csv
+from io import StringIO
+from itertools import groupby
+from operator import itemgetter
+from flask import stream_template
+from openpyxl import Workbook
+from ..models import AuditItem, Product
+from .. import db
+
+# Выгрузки аудита для страниц /audit/export/* и команды flask vercheck export-audit
+BUFFER_SIZE = 64 * 1024
+HEADER = ['Устройство', 'Ваша версия', 'Актуальная версия', 'Needs Update']
+
+
+def audit_query(user_id):
+    # Устаревшие записи определяются сравнением сортируемых ключей версий прямо в SQL
+    return db.session.query(
+        AuditItem.id, Product.vendor, Product.name, AuditItem.user_version, Product.latest_version,
+        (AuditItem.user_version_key < Product.latest_version_key).label('can_update')
+    ).join(Product, Product.id == AuditItem.product_id) \
+        .filter(AuditItem.user_id == user_id)
+
+
+def export_rows(user_id, chunk_size):
+    # Выгрузки читают аудит порциями, отсортированным по вендору, и не держат его в памяти целиком
+    query = audit_query(user_id).order_by(Product.vendor, Product.name, AuditItem.id).yield_per(chunk_size)
+    for audit_id, vendor, product_name, user_version, latest_version, can_update in query:
+        yield {
+            'vendor': vendor,
+            'product_name': product_name,
+            'user_version': user_version,
+            'latest_version': latest_version,
+            'can_update': bool(can_update)
+        }
+
+
+def csv_chunks(rows):
+    output = StringIO()
+    output.write('\ufeff')
+    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    for vendor, items in groupby(rows, key=itemgetter('vendor')):
+        writer.writerow([f"Vendor: {vendor}"])
+        writer.writerow(HEADER)
+        for item in items:
+            user_version_text = f'="{item["user_version"]}"'
+            latest_version_text = f'="{item["latest_version"]}"' if item["latest_version"] else ""
+            needs_update_text = "Yes" if item["can_update"] else "No"
+            writer.writerow([item["product_name"], user_version_text, latest_version_text, needs_update_text])
+            if output.tell() >= BUFFER_SIZE:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        writer.writerow([])  # пустая строка между группами
+    yield output.getvalue()
+
+
+def html_chunks(rows):
+    return stream_template('audit_export.html', groups=groupby(rows, key=itemgetter('vendor')))
+
+
+def write_xlsx(rows, output):
+    # write-only книга сбрасывает строки во временные файлы, поэтому память не растёт с размером аудита
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Аудит')
+    for vendor, items in groupby(rows, key=itemgetter('vendor')):
+        sheet.append([f"Vendor: {vendor}"])
+        sheet.append(HEADER)
+        for item in items:
+            sheet.append([item["product_name"], item["user_version"], item["latest_version"] or "",
+                          "Yes" if item["can_update"] else "No"])
+        sheet.append([])
+    workbook.save(output)
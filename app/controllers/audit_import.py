@@ -0,0 +1,155 @@
+import csv
+import io
+from dataclasses import dataclass, field, asdict
+from openpyxl import load_workbook
+from sqlalchemy import insert
+from ..models import AuditItem, Product
+from ..versions import version_key
+from .. import db
+from . import render_cache
+
+VENDOR_HEADERS = {'vendor', 'вендор', 'производитель'}
+PRODUCT_HEADERS = {'product', 'device', 'устройство', 'продукт'}
+VERSION_HEADERS = {'version', 'user_version', 'версия', 'ваша версия'}
+# Сколько нераспознанных имён продуктов показывать в отчёте
+UNMATCHED_LIMIT = 20
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+class _SemicolonDialect(csv.excel):
+    delimiter = ';'
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    outdated: int = 0
+    current: int = 0
+    unknown_version: int = 0
+    skipped: int = 0
+    unmatched: list = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _normalize(text):
+    return ' '.join(str(text).split()).casefold()
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = _SemicolonDialect
+    yield from csv.reader(text, dialect)
+
+
+def _xlsx_rows(stream):
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_inventory(stream, filename):
+    # Возвращает пары (вендор или None, продукт, версия). Первая строка считается заголовком,
+    # если в ней есть знакомые названия столбцов; иначе столбцы читаются как "продукт;версия".
+    name = filename.lower()
+    if name.endswith('.xlsx'):
+        rows = _xlsx_rows(stream)
+    elif name.endswith('.csv') or name.endswith('.txt'):
+        rows = _csv_rows(stream)
+    else:
+        raise ImportFormatError("Поддерживаются только файлы CSV и XLSX.")
+
+    vendor_col, product_col, version_col = None, 0, 1
+    first = True
+    for row in rows:
+        cells = [str(cell).strip() for cell in row]
+        if first:
+            first = False
+            headers = [_normalize(cell) for cell in cells]
+            if any(header in PRODUCT_HEADERS | VERSION_HEADERS for header in headers):
+                for index, header in enumerate(headers):
+                    if header in VENDOR_HEADERS:
+                        vendor_col = index
+                    elif header in PRODUCT_HEADERS:
+                        product_col = index
+                    elif header in VERSION_HEADERS:
+                        version_col = index
+                continue
+        if len(cells) <= max(product_col, version_col):
+            yield None, None, None
+            continue
+        vendor = cells[vendor_col] if vendor_col is not None and vendor_col < len(cells) else None
+        yield vendor or None, cells[product_col], cells[version_col]
+
+
+def build_product_index():
+    # Имя продукта -> (id, ключ последней версии). Продукт находится и по "Вендор Продукт",
+    # и по "Вендор - Продукт", и по одному имени, если оно не повторяется у разных вендоров.
+    index = {}
+    ambiguous = set()
+    for product_id, vendor, name, latest_key in db.session.query(
+            Product.id, Product.vendor, Product.name, Product.latest_version_key):
+        entry = (product_id, latest_key)
+        index[_normalize(f"{vendor} {name}")] = entry
+        index[_normalize(f"{vendor} - {name}")] = entry
+        key = _normalize(name)
+        if key in index and index[key][0] != product_id:
+            ambiguous.add(key)
+        index[key] = entry
+    for key in ambiguous:
+        del index[key]
+    return index
+
+
+def import_inventory(user_id, rows, batch_size=5000):
+    index = build_product_index()
+    result = ImportResult()
+    batch = []
+    for vendor, product_name, user_version in rows:
+        if not product_name or not user_version:
+            result.skipped += 1
+            continue
+        lookup = _normalize(f"{vendor} {product_name}" if vendor else product_name)
+        entry = index.get(lookup)
+        if entry is None:
+            result.skipped += 1
+            if len(result.unmatched) < UNMATCHED_LIMIT and product_name not in result.unmatched:
+                result.unmatched.append(product_name)
+            continue
+        product_id, latest_key = entry
+        user_key = version_key(user_version)
+        if user_key is None or latest_key is None:
+            result.unknown_version += 1
+        elif user_key < latest_key:
+            result.outdated += 1
+        else:
+            result.current += 1
+        batch.append({
+            'user_id': user_id,
+            'product_id': product_id,
+            'user_version': user_version,
+            'user_version_key': user_key,
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(insert(AuditItem), batch)
+            result.imported += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(AuditItem), batch)
+        result.imported += len(batch)
+    if result.imported:
+        render_cache.bump_user(user_id)
+    db.session.commit()
+    return result
@@ -0,0 +1,56 @@
+import datetime
+import hashlib
+from collections import namedtuple
+from ..models import HttpCacheEntry
+from .. import db
+
+# Валидаторы страницы, сохранённые после последней успешной обработки
+CachedPage = namedtuple('CachedPage', ['etag', 'last_modified', 'body_hash'])
+
+
+def load_cached_pages(urls):
+    entries = HttpCacheEntry.query.filter(HttpCacheEntry.url.in_(list(urls))).all()
+    return {entry.url: CachedPage(entry.etag, entry.last_modified, entry.body_hash) for entry in entries}
+
+
+def conditional_headers(headers, cached):
+    headers = dict(headers)
+    if cached:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+    return headers
+
+
+def body_hash(response):
+    return hashlib.sha256(response.content).hexdigest()
+
+
+def is_unchanged(response, cached):
+    if response.status_code == 304:
+        return True
+    return bool(cached and cached.body_hash) and response.status_code == 200 \
+        and body_hash(response) == cached.body_hash
+
+
+def page_from_response(response):
+    return CachedPage(response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash(response))
+
+
+def remember_pages(pages):
+    # Вызывается только после успешной обработки, чтобы ошибка разбора не закрепилась в кэше.
+    # Коммит выполняет вызывающий код вместе с остальными изменениями обновления.
+    if not pages:
+        return
+    entries = {entry.url: entry for entry in HttpCacheEntry.query.filter(HttpCacheEntry.url.in_(list(pages)))}
+    now = datetime.datetime.utcnow()
+    for url, page in pages.items():
+        entry = entries.get(url)
+        if not entry:
+            entry = HttpCacheEntry(url=url)
+            db.session.add(entry)
+        entry.etag = page.etag
+        entry.last_modified = page.last_modified
+        entry.body_hash = page.body_hash
+        entry.checked_at = now
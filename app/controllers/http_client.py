@@ -0,0 +1,67 @@
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    # Общий клиент для всех источников: keep-alive пул соединений на хост, таймауты,
+    # повторы с экспоненциальной задержкой и ограничение одновременных запросов к хосту.
+    def __init__(self, connect_timeout=5, read_timeout=20, retries=3, backoff_factor=0.5,
+                 backoff_jitter=0.5, pool_size=10, per_host_limit=2):
+        self.timeout = (connect_timeout, read_timeout)
+        self.per_host_limit = per_host_limit
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def get(self, url, headers=None, timeout=None, verify=True):
+        with self._slot(url):
+            return self.session.get(url, headers=headers, timeout=timeout or self.timeout,
+                                    verify=verify, allow_redirects=True)
+
+    def close(self):
+        self.session.close()
+
+
+client = HttpClient()
+
+
+def init_app(app):
+    global client
+    client.close()
+    client = HttpClient(
+        connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+        read_timeout=app.config['HTTP_READ_TIMEOUT'],
+        retries=app.config['HTTP_RETRIES'],
+        backoff_factor=app.config['HTTP_BACKOFF_FACTOR'],
+        backoff_jitter=app.config['HTTP_BACKOFF_JITTER'],
+        pool_size=app.config['HTTP_POOL_SIZE'],
+        per_host_limit=app.config['HTTP_PER_HOST_LIMIT'],
+    )
+
+
+def get(url, headers=None, timeout=None, verify=True):
+    return client.get(url, headers=headers, timeout=timeout, verify=verify)
@@ -0,0 +1,175 @@
+import datetime
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import update
+from ..models import JobLease, JobRun
+from .. import db
+from ..database import insert_ignoring_conflicts
+from . import metrics, refresh
+from .sources import SOURCES
+
+HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+# Пока строка удерживается, второе обновление не запускается ни в одном процессе
+REFRESH_LOCK = 'refresh-running'
+ACTIVE_STATUSES = ('queued', 'running')
+
+_executor = None
+
+
+def acquire_lease(name, duration):
+    # UPDATE с условием next_run_at <= now пройдёт только у одного процесса,
+    # пока срок аренды не истечёт или её не освободят
+    now = datetime.datetime.utcnow()
+    if db.session.get(JobLease, name) is None:
+        db.session.execute(insert_ignoring_conflicts(JobLease, ['name']).values(
+            name=name, holder=None, next_run_at=now))
+        db.session.commit()
+    result = db.session.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.next_run_at <= now)
+        .values(holder=HOLDER, next_run_at=now + duration)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _release(name):
+    return update(JobLease) \
+        .where(JobLease.name == name, JobLease.holder == HOLDER) \
+        .values(holder=None, next_run_at=datetime.datetime.utcnow())
+
+
+def release_lease(name):
+    db.session.execute(_release(name))
+    db.session.commit()
+
+
+def begin_refresh(app, keys=None, trigger='manual'):
+    # Запись JobRun создаётся до взятия REFRESH_LOCK, поэтому у держателя блокировки всегда есть
+    # задача queued/running и active_refresh её находит. Возвращает задачу или None, если
+    # обновление уже идёт; своя запись тогда удаляется.
+    keys = list(keys) if keys else list(SOURCES)
+    run = JobRun(job='refresh', trigger=trigger, status='queued', sources={
+        key: {'key': key, 'title': SOURCES[key].title, 'status': 'pending', 'message': '', 'duration': 0.0}
+        for key in keys
+    })
+    db.session.add(run)
+    db.session.commit()
+    # Держатель освобождает блокировку, сбрасывая holder; если он остался, срок истёк у упавшего процесса
+    stale_holder = db.session.query(JobLease.holder).filter(JobLease.name == REFRESH_LOCK).scalar()
+    if not acquire_lease(REFRESH_LOCK, datetime.timedelta(seconds=app.config['REFRESH_JOB_TIMEOUT'])):
+        db.session.delete(run)
+        db.session.commit()
+        return None
+    if stale_holder:
+        db.session.execute(
+            update(JobRun)
+            .where(JobRun.job == 'refresh', JobRun.id < run.id, JobRun.status.in_(ACTIVE_STATUSES))
+            .values(status='error', finished_at=datetime.datetime.utcnow())
+        )
+        db.session.commit()
+    return run
+
+
+def _progress_recorder(run):
+    def record(outcome):
+        # JSON-столбец отслеживается только при присваивании нового объекта
+        sources = dict(run.sources or {})
+        sources[outcome.key] = outcome.as_dict()
+        run.sources = sources
+        if run.status == 'queued':
+            run.status = 'running'
+        db.session.commit()
+    return record
+
+
+def run_refresh_job(keys=None, trigger='manual', run=None, max_workers=None, lock=None):
+    # Обновление с записью в JobRun; не использует flash и другие API запроса,
+    # поэтому может выполняться в фоне внутри app_context. Блокировка lock снимается
+    # в одной транзакции с итоговым статусом: пока она занята, задача видна как активная.
+    if run is None:
+        run = JobRun(job='refresh', trigger=trigger, status='running')
+        db.session.add(run)
+        db.session.commit()
+    run.status = 'running'
+    db.session.commit()
+    started = time.monotonic()
+    try:
+        with metrics.scope('refresh'):
+            outcomes = refresh.refresh_sources(keys, max_workers=max_workers, on_progress=_progress_recorder(run))
+    except Exception as e:
+        db.session.rollback()
+        run.status = 'error'
+        run.sources = dict(run.sources or {}, error=str(e))
+        outcomes = []
+    else:
+        # Если не удался ни один источник, обновление не выполнено вовсе
+        succeeded = sum(1 for outcome in outcomes if outcome.succeeded)
+        if succeeded == len(outcomes):
+            run.status = 'ok'
+        elif succeeded:
+            run.status = 'partial'
+        else:
+            run.status = 'error'
+        run.sources = {outcome.key: outcome.as_dict() for outcome in outcomes}
+    run.finished_at = datetime.datetime.utcnow()
+    run.duration = time.monotonic() - started
+    if lock:
+        db.session.execute(_release(lock))
+    db.session.commit()
+    return run, outcomes
+
+
+def run_locked_refresh(app, keys=None, trigger='manual', run_id=None):
+    # Вызывается после begin_refresh, когда REFRESH_LOCK уже взят
+    with app.app_context():
+        try:
+            run = db.session.get(JobRun, run_id) if run_id else None
+            return run_refresh_job(keys, trigger, run, lock=REFRESH_LOCK)
+        except BaseException:
+            db.session.rollback()
+            release_lease(REFRESH_LOCK)
+            raise
+        finally:
+            db.session.remove()
+            metrics.registry.flush()
+
+
+def active_refresh():
+    return JobRun.query.filter(JobRun.job == 'refresh', JobRun.status.in_(ACTIVE_STATUSES)) \
+        .order_by(JobRun.id.desc()).first()
+
+
+def enqueue_refresh(app, keys=None, trigger='manual'):
+    # Возвращает (JobRun, создан ли новый). Если обновление уже идёт, новое не ставится,
+    # а возвращается текущее — повторные нажатия не запускают параллельный сбор.
+    global _executor
+    keys = list(keys) if keys else list(SOURCES)
+    run = begin_refresh(app, keys, trigger)
+    if run is None:
+        active = active_refresh()
+        if active is not None:
+            return active, False
+        # Текущее обновление завершилось между попыткой и поиском задачи — пробуем ещё раз
+        run = begin_refresh(app, keys, trigger)
+        if run is None:
+            return active_refresh(), False
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='refresh-job')
+    _executor.submit(run_locked_refresh, app, keys, trigger, run.id)
+    return run, True
+
+
+def job_progress(run):
+    return {
+        'id': run.id,
+        'job': run.job,
+        'trigger': run.trigger,
+        'status': run.status,
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+        'duration': run.duration,
+        'sources': run.sources or {},
+    }
@@ -0,0 +1,233 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Метрики в текстовом формате Prometheus. Каждый процесс (воркер gunicorn) копит значения
+# у себя и периодически сбрасывает снимок в файл <pid>-<метка запуска>.json общего каталога; /metrics
+# складывает снимки всех процессов, поэтому ответ не зависит от того, какой воркер его отдал.
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRICS = {
+    'vercheck_http_requests_total': ('counter', 'Обработанные HTTP-запросы.'),
+    'vercheck_http_request_duration_seconds': ('histogram', 'Время обработки HTTP-запроса по эндпоинтам.'),
+    'vercheck_http_request_sql_statements': ('histogram', 'Число SQL-запросов за один HTTP-запрос.'),
+    'vercheck_sql_statements_total': ('counter', 'SQL-запросы по контексту выполнения.'),
+    'vercheck_refresh_phase_seconds': ('histogram', 'Длительность этапов обновления источников.'),
+    'vercheck_refresh_sources_total': ('counter', 'Результаты обновления источников.'),
+    'vercheck_render_cache_total': ('counter', 'Обращения к кэшу фрагментов страниц.'),
+}
+BUCKETS = {
+    'vercheck_http_request_sql_statements': STATEMENT_BUCKETS,
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.directory = None
+        self.flush_interval = 5
+        self._flushed_at = 0.0
+        self._owner = None
+        self._filename = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = BUCKETS.get(name, TIME_BUCKETS)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+    def _own_filename(self):
+        # pid повторно выдаётся новым процессам, поэтому к нему добавляется метка запуска:
+        # новый воркер не перезапишет снимок завершившегося. Метка меняется и после fork.
+        pid = os.getpid()
+        if self._owner != pid:
+            self._owner = pid
+            self._filename = f'{pid}-{uuid.uuid4().hex}.json'
+        return self._filename
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, self._own_filename())
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        self._flushed_at = time.monotonic()
+
+    def flush_if_due(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def _snapshots(self):
+        # Свой снимок берём из памяти, чужие — из файлов; файлы завершившихся процессов
+        # остаются, чтобы счётчики не уменьшались после перезапуска воркеров
+        snapshots = [self.snapshot()]
+        own = self._own_filename()
+        if self.directory and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json') or filename == own:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def collect(self):
+        counters = {}
+        histograms = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, h in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = histograms.setdefault(key, {'counts': [0] * len(h['counts']), 'sum': 0.0, 'count': 0})
+                total['counts'] = [a + b for a, b in zip(total['counts'], h['counts'])]
+                total['sum'] += h['sum']
+                total['count'] += h['count']
+        return render(counters, histograms)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+            continue
+        buckets = BUCKETS.get(name, TIME_BUCKETS)
+        for (metric, labels), h in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(buckets, h['counts']):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {h["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {h["sum"]}')
+            lines.append(f'{name}_count{_labels(labels)} {h["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+_local = threading.local()
+
+
+class _Scope:
+    # Контекст, которому засчитываются SQL-запросы текущего потока (HTTP-запрос, фоновая задача)
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.started = time.perf_counter()
+        self.previous = getattr(_local, 'scope', None)
+        _local.scope = self
+
+    def close(self):
+        _local.scope = self.previous
+        registry.inc('vercheck_sql_statements_total', self.statements, scope=self.name)
+
+
+@contextmanager
+def scope(name):
+    current = _Scope(name)
+    try:
+        yield current
+    finally:
+        current.close()
+
+
+@contextmanager
+def phase(name, source):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('vercheck_refresh_phase_seconds', time.perf_counter() - started, phase=name, source=source)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    current = getattr(_local, 'scope', None)
+    if current is not None:
+        current.statements += 1
+
+
+def _start_request():
+    _local.request = _Scope(request.endpoint or 'unknown')
+    _local.status = 500
+
+
+def _remember_status(response):
+    _local.status = response.status_code
+    return response
+
+
+def _finish_request(exc=None):
+    # teardown выполняется и после ошибки; для stream_with_context — после отдачи ответа целиком
+    current = getattr(_local, 'request', None)
+    if current is None:
+        return
+    _local.request = None
+    current.close()
+    registry.inc('vercheck_http_requests_total', endpoint=current.name, method=request.method,
+                 status=_local.status)
+    registry.observe('vercheck_http_request_duration_seconds', time.perf_counter() - current.started,
+                     endpoint=current.name)
+    registry.observe('vercheck_http_request_sql_statements', current.statements, endpoint=current.name)
+    registry.flush_if_due()
+
+
+def init_app(app):
+    if not app.config['METRICS_DIR']:
+        app.config['METRICS_DIR'] = os.path.join(app.instance_path, 'metrics')
+    registry.directory = app.config['METRICS_DIR']
+    registry.flush_interval = app.config['METRICS_FLUSH_SECONDS']
+    os.makedirs(registry.directory, exist_ok=True)
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+        atexit.register(registry.flush)
+    app.before_request(_start_request)
+    app.after_request(_remember_status)
+    app.teardown_request(_finish_request)
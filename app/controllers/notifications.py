@@ -0,0 +1,131 @@
+from collections import Counter, namedtuple
+from sqlalchemy import bindparam, case, func, select, update
+from ..models import Product, Notification, User
+from .. import db
+from ..database import insert_ignoring_conflicts
+from ..utils import with_accepted_versions
+
+# Новая версия продукта, найденная при обновлении; version_key — стратегия сравнения версий источника
+VersionChange = namedtuple('VersionChange', ['product_id', 'vendor', 'name', 'version', 'version_key'])
+
+
+MESSAGE_LENGTH = Notification.message.type.length
+
+
+def digest_message(changes):
+    # Все изменения обновления в одной строке; что не помещается в поле, сокращается до "и ещё N"
+    items = [f"{change.vendor} {change.name} {change.version}" for change in changes]
+    message = f"Новые версии ({len(items)}): " + ", ".join(items)
+    shown = len(items)
+    while len(message) > MESSAGE_LENGTH and shown > 1:
+        shown -= 1
+        message = f"Новые версии ({len(items)}): " + ", ".join(items[:shown]) + f" и ещё {len(items) - shown}"
+    return message[:MESSAGE_LENGTH]
+
+
+def fan_out(changes):
+    # Без запросов на каждого пользователя: одна выборка пар (подписанный пользователь,
+    # продукт) с принятой версией, пачечная вставка и одно обновление счётчиков.
+    # Записи о принятых версиях не создаются: без записи пользователя действует базовая версия продукта.
+    if not changes:
+        return 0
+    by_product = {change.product_id: change for change in changes}
+    pairs = with_accepted_versions(
+        db.session.query(User.id, User.notify_digest, Product.id)
+        .select_from(User)
+        .join(Product, Product.id.in_(list(by_product)))
+        .filter(User.notify.is_(True)),
+        User.id
+    )
+
+    notifications = []
+    digests = {}
+    for user_id, digest, product_id, accepted_version, _, _ in pairs:
+        change = by_product[product_id]
+        accepted_key = change.version_key(accepted_version) if accepted_version else None
+        if accepted_key is not None and change.version_key(change.version) <= accepted_key:
+            continue
+        if digest:
+            digests.setdefault(user_id, []).append(change)
+        else:
+            notifications.append({
+                'user_id': user_id,
+                'product_id': product_id,
+                'version': change.version,
+                'message': f"Новая версия для {change.vendor} {change.name}: {change.version}",
+            })
+    for user_id, user_changes in digests.items():
+        notifications.append({
+            'user_id': user_id,
+            'product_id': None,
+            'version': None,
+            'message': digest_message(user_changes),
+        })
+
+    if notifications:
+        # Повторное уведомление о той же версии отбрасывает уникальный индекс, поэтому счётчики
+        # увеличиваются на число действительно вставленных строк (RETURNING), а не попыток
+        statement = insert_ignoring_conflicts(Notification, ['user_id', 'product_id', 'version'])
+        if db.session.get_bind().dialect.insert_executemany_returning:
+            inserted = Counter(db.session.scalars(statement.returning(Notification.user_id), notifications))
+        else:
+            # Без ON CONFLICT дубликат прервёт вставку, так что вставлены все строки
+            db.session.execute(statement, notifications)
+            inserted = Counter(note['user_id'] for note in notifications)
+        _add_unread(inserted)
+    return len(notifications)
+
+
+def _add_unread(counts):
+    if not counts:
+        return
+    users = User.__table__
+    db.session.execute(
+        update(users).where(users.c.id == bindparam('_id'))
+        .values(unread_notifications=users.c.unread_notifications + bindparam('_count')),
+        [{'_id': user_id, '_count': count} for user_id, count in counts.items()]
+    )
+
+
+def recount_unread(connection=None, user_ids=None):
+    # Пересчёт счётчика по таблице уведомлений: миграция и ремонт командой recount-unread
+    unread = select(func.count(Notification.id)) \
+        .where(Notification.user_id == User.id, Notification.read.is_(False)) \
+        .scalar_subquery()
+    statement = update(User).values(unread_notifications=unread)
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(list(user_ids)))
+    return (connection or db.session).execute(statement).rowcount
+
+
+def notifications_page(user_id, before=None, limit=50, unread_only=False):
+    # Постраничная выборка по ключу: страница начинается с id меньше последнего показанного,
+    # поэтому глубина прокрутки не влияет на стоимость запроса
+    query = Notification.query.filter(Notification.user_id == user_id)
+    if unread_only:
+        query = query.filter(Notification.read.is_(False))
+    if before:
+        query = query.filter(Notification.id < before)
+    items = query.order_by(Notification.id.desc()).limit(limit + 1).all()
+    next_before = items[limit - 1].id if len(items) > limit else None
+    return items[:limit], next_before
+
+
+def mark_read(user, ids=None):
+    # Один UPDATE по всем (или выбранным) непрочитанным уведомлениям пользователя
+    statement = update(Notification) \
+        .where(Notification.user_id == user.id, Notification.read.is_(False)) \
+        .values(read=True).execution_options(synchronize_session=False)
+    if ids is not None:
+        statement = statement.where(Notification.id.in_(list(ids)))
+    marked = db.session.execute(statement).rowcount
+    # Счётчик уменьшается выражением в БД: значение в сессии могло устареть из-за параллельной рассылки
+    if marked:
+        users = User.__table__
+        db.session.execute(
+            update(users).where(users.c.id == user.id)
+            .values(unread_notifications=case(
+                (users.c.unread_notifications > marked, users.c.unread_notifications - marked), else_=0))
+        )
+        db.session.refresh(user, ['unread_notifications'])
+    return marked
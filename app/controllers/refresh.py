@@ -0,0 +1,261 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+from dataclasses import dataclass, asdict, field
+from flask import current_app
+from ..models import Product, ProductVersion
+from .. import db
+from .product_updates import HEADERS, SourceError, parse_page
+from .sources import SOURCES
+from . import http_cache, http_client, metrics, notifications, render_cache, snapshots
+
+
+@dataclass
+class SourceOutcome:
+    key: str
+    title: str
+    status: str  # ok | not_modified | error | timeout (fetched — промежуточный)
+    message: str
+    duration: float
+    # Длительность этапов источника в секундах: fetch, parse, diff
+    phases: dict = field(default_factory=dict)
+
+    @property
+    def succeeded(self):
+        return self.status in ('ok', 'not_modified')
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class _Fetched:
+    rows: list  # None, если страница не изменилась
+    page: http_cache.CachedPage
+    duration: float
+    phases: dict
+
+
+def _fetch_and_extract(source, cached, timeout, parser, archive_dir=None, taken=None):
+    # Работает в потоке пула: только сеть, архив страниц и разбор HTML, без обращений к БД.
+    # Сохранённый в архив снимок отмечается в taken, запись о нём добавляет основной поток
+    started = time.monotonic()
+    headers = http_cache.conditional_headers(HEADERS, cached)
+    with metrics.phase('fetch', source.key):
+        response = http_client.get(source.url, headers=headers, timeout=timeout, verify=source.verify)
+    fetched = time.monotonic()
+    phases = {'fetch': fetched - started}
+    if response.status_code not in (200, 304):
+        raise SourceError(f"Ошибка получения данных для {source.title}.")
+    if http_cache.is_unchanged(response, cached):
+        return _Fetched(None, cached, fetched - started, phases)
+    page = http_cache.page_from_response(response)
+    if archive_dir:
+        # До разбора: снимок нужен и тогда, когда разметка изменилась и извлечение падает
+        try:
+            snapshots.write_body(archive_dir, page.body_hash, response.content)
+            taken[source.key] = (page.body_hash, len(response.content), response.encoding)
+        except OSError:
+            pass
+    with metrics.phase('parse', source.key):
+        soup = parse_page(response.text, parser, source.parse_only)
+        rows = source.extractor(soup)
+    phases['parse'] = time.monotonic() - fetched
+    return _Fetched(rows, page, time.monotonic() - started, phases)
+
+
+def _latest_rows(source, rows):
+    # По каждому продукту оставляем самую новую версию согласно стратегии сравнения источника
+    latest = {}
+    for row in rows:
+        name = row.product or source.product
+        key = source.version_key(row.version)
+        if key is None:
+            continue
+        if name not in latest or key > latest[name][0]:
+            latest[name] = (key, row)
+    return {name: row for name, (_, row) in latest.items()}
+
+
+def _fingerprint(row):
+    # Отпечаток строки источника: совпал с сохранённым — продукт не изменился и дальше не обрабатывается
+    raw = '\x1f'.join((row.version or '', row.release_date or '', row.title or ''))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _stored_fingerprints(vendors):
+    rows = db.session.query(Product.vendor, Product.name, Product.id, Product.source_fingerprint) \
+        .filter(Product.vendor.in_(vendors))
+    return {(vendor, name): (product_id, fingerprint) for vendor, name, product_id, fingerprint in rows}
+
+
+def _changed_rows(source, rows, stored):
+    # {продукт: (id или None для нового, строка, отпечаток)} только для изменившихся строк
+    changed = {}
+    for name, row in rows.items():
+        product_id, fingerprint = stored.get((source.vendor, name), (None, None))
+        current = _fingerprint(row)
+        if current != fingerprint:
+            changed[name] = (product_id, row, current)
+    return changed
+
+
+def _persist(fetched):
+    # Одна транзакция на всё обновление и только для изменившихся строк: их продукты и версии
+    # загружаются одним запросом каждый, новые строки добавляются пачкой при flush
+    added = {source.key: 0 for source, _ in fetched}
+    if not any(rows for _, rows in fetched):
+        return added, []
+    product_ids = [product_id for _, rows in fetched for product_id, _, _ in rows.values() if product_id]
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids))} if product_ids else {}
+    known_versions = set(
+        db.session.query(ProductVersion.product_id, ProductVersion.version)
+        .filter(ProductVersion.product_id.in_(product_ids))
+    ) if product_ids else set()
+
+    previous_latest = {}
+    resolved = {}
+    for source, rows in fetched:
+        for name, (product_id, row, fingerprint) in rows.items():
+            # Один продукт могут вернуть несколько источников вендора
+            prod = resolved.get((source.vendor, name)) or products.get(product_id)
+            if not prod:
+                prod = Product(vendor=source.vendor, name=name, latest_version=row.version,
+                               baseline_version=row.version)
+                db.session.add(prod)
+            previous_latest.setdefault((source.vendor, name), prod.latest_version if product_id else None)
+            prod.source_fingerprint = fingerprint
+            resolved[(source.vendor, name)] = prod
+    db.session.flush()
+
+    changes = []
+    catalogue_changed = False
+    for source, rows in fetched:
+        for name, (product_id, row, _) in rows.items():
+            prod = resolved[(source.vendor, name)]
+            previous = previous_latest[(source.vendor, name)]
+            if not product_id:
+                catalogue_changed = True
+            if (prod.id, row.version) not in known_versions:
+                db.session.add(ProductVersion(
+                    product_id=prod.id,
+                    version=row.version,
+                    release_date=row.release_date,
+                    full_title=row.title
+                ))
+                known_versions.add((prod.id, row.version))
+                added[source.key] += 1
+                catalogue_changed = True
+                changes.append(notifications.VersionChange(
+                    prod.id, prod.vendor, prod.name, row.version, source.version_key
+                ))
+            # latest_version двигаем только вперёд
+            previous_key = source.version_key(previous) if previous else None
+            if previous_key is None or previous_key < source.version_key(row.version):
+                catalogue_changed = catalogue_changed or prod.latest_version != row.version
+                prod.latest_version = row.version
+
+    if catalogue_changed:
+        render_cache.bump_catalogue()
+    return added, changes
+
+
+def _outcome_message(source, rows, added):
+    if not rows:
+        return f"Подходящих версий для {source.title} не найдено."
+    if added:
+        return f"Добавлено новых версий: {added}"
+    return "Новых версий не обнаружено"
+
+
+def refresh_sources(keys=None, max_workers=None, source_timeout=None, deadline=None, on_progress=None):
+    # on_progress(outcome) вызывается в потоке приложения по мере готовности источников;
+    # промежуточный статус 'fetched' означает, что страница разобрана и ждёт сохранения
+    config = current_app.config
+    keys = list(keys) if keys else list(SOURCES)
+    max_workers = max_workers or config['REFRESH_MAX_WORKERS']
+    deadline = deadline or config['REFRESH_DEADLINE']
+
+    started = time.monotonic()
+    outcomes = {}
+    results = {}
+
+    def report(key, status, message, duration):
+        phases = results[key].phases if key in results else {}
+        outcome = SourceOutcome(key, SOURCES[key].title, status, message, duration, dict(phases))
+        if status != 'fetched':
+            outcomes[key] = outcome
+            metrics.registry.inc('vercheck_refresh_sources_total', source=key, status=status)
+        if on_progress:
+            on_progress(outcome)
+
+    cached_pages = http_cache.load_cached_pages(SOURCES[key].url for key in keys)
+    archive_dir = config['SNAPSHOT_DIR'] if config['SNAPSHOT_ENABLED'] else None
+    taken = {}
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(keys)), thread_name_prefix='refresh')
+    futures = {
+        executor.submit(_fetch_and_extract, SOURCES[key], cached_pages.get(SOURCES[key].url), source_timeout,
+                        config['HTML_PARSER'], archive_dir, taken): key
+        for key in keys
+    }
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            key = futures[future]
+            try:
+                result = future.result()
+            except SourceError as e:
+                report(key, 'error', str(e), time.monotonic() - started)
+            except Exception as e:
+                report(key, 'error', f"Ошибка: {str(e)}", time.monotonic() - started)
+            else:
+                results[key] = result
+                if result.rows is None:
+                    report(key, 'not_modified', "Изменений на странице нет.", result.duration)
+                else:
+                    report(key, 'fetched', "Страница получена, данные сохраняются.", result.duration)
+    except FuturesTimeoutError:
+        elapsed = time.monotonic() - started
+        for future, key in futures.items():
+            if key not in outcomes and key not in results:
+                future.cancel()
+                report(key, 'timeout', "Превышено время ожидания ответа.", elapsed)
+    finally:
+        # Зависшие запросы не должны задерживать ответ: не ждём их завершения
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    changed = []
+    pending = []
+    fetched_keys = [key for key, result in results.items() if result.rows is not None]
+    # Отпечатки всех продуктов обновляемых вендоров — одним запросом
+    stored = _stored_fingerprints({SOURCES[key].vendor for key in fetched_keys}) if fetched_keys else {}
+    for key in fetched_keys:
+        result = results[key]
+        diff_started = time.monotonic()
+        with metrics.phase('diff', key):
+            rows = _latest_rows(SOURCES[key], result.rows)
+            changed.append((SOURCES[key], rows))
+            pending.append((SOURCES[key], _changed_rows(SOURCES[key], rows, stored)))
+        result.phases['diff'] = time.monotonic() - diff_started
+    if changed:
+        # Сохранение и рассылка выполняются одной пачкой для всех источников
+        try:
+            with metrics.phase('persist', 'all'):
+                added, changes = _persist(pending)
+                http_cache.remember_pages({source.url: results[source.key].page for source, _ in changed})
+            with metrics.phase('notify', 'all'):
+                notifications.fan_out(changes)
+            with metrics.phase('commit', 'all'):
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for source, _ in changed:
+                report(source.key, 'error', f"Ошибка: {str(e)}", results[source.key].duration)
+        else:
+            for source, rows in changed:
+                report(source.key, 'ok', _outcome_message(source, rows, added[source.key]),
+                       results[source.key].duration)
+    if taken:
+        # Отдельной транзакцией: снимки страниц с ошибкой разбора тоже записываются
+        snapshots.record(dict(taken))
+        db.session.commit()
+    return [outcomes[key] for key in keys]
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from flask import current_app
+from sqlalchemy import update
+from ..models import CacheStamp
+from .. import db
+from ..database import insert_ignoring_conflicts
+from . import metrics
+
+# Кэш отрисованных фрагментов страниц (таблицы вендоров на дашборде и в аудите).
+# Ключ включает номера версий данных из CacheStamp, поэтому фрагменты не удаляются при изменениях:
+# обновление, меняющее последние версии, увеличивает 'catalogue', действия пользователя — 'user:<id>',
+# и прежние записи просто перестают запрашиваться, пока их не вытеснит ограничение размера.
+# Хранилище — файл SQLite, общий для воркеров gunicorn.
+
+CATALOGUE = 'catalogue'
+
+
+def user_stamp(user_id):
+    return f'user:{user_id}'
+
+
+def _bump(name):
+    # Выполняется в транзакции изменения, чтобы номер и данные фиксировались вместе
+    db.session.execute(insert_ignoring_conflicts(CacheStamp, ['name']).values(name=name, value=0))
+    db.session.execute(
+        update(CacheStamp).where(CacheStamp.name == name).values(value=CacheStamp.value + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_catalogue():
+    _bump(CATALOGUE)
+
+
+def bump_user(user_id):
+    _bump(user_stamp(user_id))
+
+
+def current_stamps(user_id):
+    names = [CATALOGUE, user_stamp(user_id)]
+    values = dict(db.session.query(CacheStamp.name, CacheStamp.value).filter(CacheStamp.name.in_(names)))
+    return tuple(values.get(name, 0) for name in names)
+
+
+class FragmentStore:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS fragments ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_fragments_stored_at ON fragments (stored_at)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value FROM fragments WHERE key = ?', (key,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def set(self, key, value):
+        blob = zlib.compress(value.encode('utf-8'))
+        if len(blob) > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO fragments (key, value, size, stored_at) VALUES (?, ?, ?, ?)',
+                           (key, blob, len(blob), time.time()))
+        self._evict(connection)
+
+    def _evict(self, connection):
+        # Вытесняются самые давние записи, пока общий размер не станет меньше предела
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM fragments').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes * 0.9
+        stale = []
+        for key, size in connection.execute('SELECT key, size FROM fragments ORDER BY stored_at'):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        connection.executemany('DELETE FROM fragments WHERE key = ?', stale)
+
+    def clear(self):
+        return self._connection().execute('DELETE FROM fragments').rowcount
+
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def init_app(app):
+    if not app.config['RENDER_CACHE_PATH']:
+        app.config['RENDER_CACHE_PATH'] = os.path.join(app.instance_path, 'render-cache.sqlite')
+
+
+def store():
+    path = current_app.config['RENDER_CACHE_PATH']
+    with _lock:
+        if path not in _stores:
+            _stores[path] = FragmentStore(path, current_app.config['RENDER_CACHE_MAX_BYTES'])
+        return _stores[path]
+
+
+def cached_fragment(name, render, user_id=None, stamps=None):
+    # render() строит фрагмент и выполняется только при промахе; при ошибке хранилища
+    # страница отрисовывается как без кэша
+    if not current_app.config['RENDER_CACHE_ENABLED']:
+        return render()
+    catalogue, user = stamps if stamps is not None else current_stamps(user_id)
+    key = f'{name}:{user_id}:{catalogue}:{user if user_id is not None else 0}'
+    try:
+        html = store().get(key)
+    except sqlite3.Error:
+        current_app.logger.exception('Ошибка чтения кэша фрагментов')
+        return render()
+    if html is not None:
+        metrics.registry.inc('vercheck_render_cache_total', fragment=name, result='hit')
+        return html
+    metrics.registry.inc('vercheck_render_cache_total', fragment=name, result='miss')
+    html = render()
+    try:
+        store().set(key, html)
+    except sqlite3.Error:
+        current_app.logger.exception('Ошибка записи в кэш фрагментов')
+    return html
@@ -1,16 +1,45 @@
+import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.controllers import product_updates
+from app import db
+from app.controllers import jobs, snapshots
 
-def scheduled_update():
-    product_updates.update_kaspersky_internal()
-    product_updates.update_usergate_ngfw_internal_7()
-    product_updates.update_usergate_management_center_internal_7()
-    product_updates.update_usergate_ngfw_internal_6()
-    product_updates.update_usergate_management_center_internal_6()
-    product_updates.update_securitycode_internal()
-    # Если нужно, можно добавить логирование или отправку уведомлений
+REFRESH_JOB = 'refresh'
 
-scheduler = BackgroundScheduler()
-# Запускаем задачу один раз в 24 часа:
-scheduler.add_job(scheduled_update, 'interval', hours=24)
-scheduler.start()
\ No newline at end of file
+scheduler = None
+
+
+def scheduled_update(app):
+    with app.app_context():
+        interval = datetime.timedelta(hours=app.config['SCHEDULER_INTERVAL_HOURS'])
+        try:
+            # Слот на интервал забирает один процесс; если в этот момент идёт другое обновление
+            # (возможно, одного источника), слот возвращается и следующая проверка повторит попытку
+            if not jobs.acquire_lease(REFRESH_JOB, interval):
+                return
+            run = jobs.begin_refresh(app, trigger='schedule')
+            if run is None:
+                jobs.release_lease(REFRESH_JOB)
+                return
+            run_id = run.id
+        finally:
+            db.session.remove()
+        jobs.run_locked_refresh(app, trigger='schedule', run_id=run_id)
+    # Чистка архива страниц раз в интервал, тем же процессом, что выполнил плановое обновление
+    with app.app_context():
+        try:
+            snapshots.prune(app.config['SNAPSHOT_DIR'], app.config['SNAPSHOT_RETENTION_DAYS'],
+                            app.config['SNAPSHOT_KEEP_LATEST'])
+        finally:
+            db.session.remove()
+
+
+def init_app(app):
+    global scheduler
+    if not app.config['SCHEDULER_ENABLED'] or scheduler is not None:
+        return
+    scheduler = BackgroundScheduler(daemon=True)
+    # Частая проверка слота: после перезапуска воркеров обновление не ждёт полный интервал
+    scheduler.add_job(scheduled_update, 'interval', args=[app], id=REFRESH_JOB,
+                      seconds=app.config['SCHEDULER_TICK_SECONDS'], max_instances=1, coalesce=True,
+                      next_run_time=datetime.datetime.now())
+    scheduler.start()
@@ -0,0 +1,193 @@
+import datetime
+import gzip
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import delete, func, insert, select
+from ..models import Product, ProductVersion, Snapshot
+from .. import db
+from ..database import insert_ignoring_conflicts
+from .product_updates import parse_page
+from .sources import SOURCES
+from . import render_cache
+
+# Архив полученных страниц источников. Тело хранится сжатым в файле <каталог>/<ab>/<sha256>.html.gz,
+# поэтому одинаковые страницы занимают один файл; таблица Snapshot хранит, что и когда получено.
+# По архиву можно заново извлечь версии после исправления селекторов, не обращаясь к сайтам.
+
+SUFFIX = '.html.gz'
+# Файлы без записи в таблице моложе этого срока не удаляются: запись ещё может быть не закоммичена
+ORPHAN_GRACE_SECONDS = 3600
+
+ReplayResult = namedtuple('ReplayResult', ['snapshots', 'failed', 'products_added', 'versions_added',
+                                           'versions_skipped'])
+
+
+def init_app(app):
+    if not app.config['SNAPSHOT_DIR']:
+        app.config['SNAPSHOT_DIR'] = os.path.join(app.instance_path, 'snapshots')
+
+
+def archive_path(directory, digest):
+    return os.path.join(directory, digest[:2], digest + SUFFIX)
+
+
+def write_body(directory, digest, body):
+    # Вызывается из потоков обновления, без обращений к БД; существующий файл не переписывается
+    path = archive_path(directory, digest)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_body(directory, digest):
+    with gzip.open(archive_path(directory, digest), 'rb') as f:
+        return f.read()
+
+
+def record(taken):
+    # taken: {ключ источника: (sha256, размер, кодировка)}; коммит выполняет вызывающий код
+    now = datetime.datetime.utcnow()
+    db.session.execute(insert(Snapshot), [
+        {'source_key': key, 'url': SOURCES[key].url, 'digest': digest, 'size': size, 'encoding': encoding,
+         'fetched_at': now}
+        for key, (digest, size, encoding) in taken.items()
+    ])
+
+
+def prune(directory, retention_days, keep_latest):
+    # Удаляет записи старше срока, кроме keep_latest последних по каждому источнику,
+    # затем файлы, на которые не осталось записей. Возвращает (записей, файлов).
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    ranked = select(
+        Snapshot.id, Snapshot.fetched_at,
+        func.row_number().over(partition_by=Snapshot.source_key, order_by=Snapshot.fetched_at.desc()).label('rank')
+    ).subquery()
+    expired = select(ranked.c.id).where(ranked.c.rank > keep_latest, ranked.c.fetched_at < cutoff)
+    removed_rows = db.session.execute(delete(Snapshot).where(Snapshot.id.in_(expired))).rowcount
+    db.session.commit()
+
+    referenced = set(db.session.scalars(select(Snapshot.digest).distinct()))
+    removed_files = 0
+    if not os.path.isdir(directory):
+        return removed_rows, removed_files
+    stale = time.time() - ORPHAN_GRACE_SECONDS
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if filename.endswith(SUFFIX) and filename[:-len(SUFFIX)] in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) < stale:
+                    os.remove(path)
+                    removed_files += 1
+            except OSError:
+                continue
+    return removed_rows, removed_files
+
+
+def _extract_snapshot(directory, digest, source_key, encoding, parser):
+    # Выполняется в процессе пула: только чтение файла и разбор, без БД
+    source = SOURCES[source_key]
+    markup = read_body(directory, digest).decode(encoding or 'utf-8', errors='replace')
+    return source.extractor(parse_page(markup, parser, source.parse_only))
+
+
+def _extracted_versions(results):
+    # {(вендор, продукт): (источник, {версия: строка})} — все версии, встреченные в снимках
+    versions = {}
+    for source, rows in results:
+        for row in rows:
+            if source.version_key(row.version) is None:
+                continue
+            _, found = versions.setdefault((source.vendor, row.product or source.product), (source, {}))
+            found.setdefault(row.version, row)
+    return versions
+
+
+def replay(directory, keys=None, since=None, workers=None, parser='lxml'):
+    # Повторное извлечение версий из архива в параллельных процессах. Добавляет отсутствующие
+    # продукты и строки ProductVersion; последние и принятые версии продуктов не меняет.
+    # Версии новее последней версии продукта пропускаются: их найдёт обычное обновление
+    # и разошлёт уведомления, а уже известную версию оно считало бы старой.
+    keys = list(keys) if keys else list(SOURCES)
+    query = db.session.query(Snapshot.source_key, Snapshot.digest, func.max(Snapshot.encoding)) \
+        .filter(Snapshot.source_key.in_(keys))
+    if since:
+        query = query.filter(Snapshot.fetched_at >= since)
+    # Одинаковое тело разбирается один раз
+    snapshots = query.group_by(Snapshot.source_key, Snapshot.digest).all()
+
+    results = []
+    failed = []
+    if snapshots:
+        # spawn: дочерние процессы не наследуют соединения с БД и потоки родителя
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(_extract_snapshot, directory, digest, key, encoding, parser): (key, digest)
+                for key, digest, encoding in snapshots
+            }
+            for future in as_completed(futures):
+                key, digest = futures[future]
+                try:
+                    results.append((SOURCES[key], future.result()))
+                except Exception as e:
+                    failed.append((key, digest, str(e)))
+
+    versions = _extracted_versions(results)
+    if not versions:
+        return ReplayResult(len(snapshots), failed, 0, 0, 0)
+
+    vendors = {vendor for vendor, _ in versions}
+
+    def load_products():
+        return {(vendor, name): (product_id, latest) for vendor, name, product_id, latest in
+                db.session.query(Product.vendor, Product.name, Product.id, Product.latest_version)
+                .filter(Product.vendor.in_(vendors))}
+
+    products = load_products()
+    new_products = []
+    for (vendor, name), (source, found) in versions.items():
+        if (vendor, name) not in products:
+            latest = max(found, key=source.version_key)
+            new_products.append({'vendor': vendor, 'name': name, 'latest_version': latest,
+                                 'baseline_version': latest})
+    if new_products:
+        db.session.execute(insert_ignoring_conflicts(Product, ['vendor', 'name']), new_products)
+        products = load_products()
+
+    known = set(
+        db.session.query(ProductVersion.product_id, ProductVersion.version)
+        .filter(ProductVersion.product_id.in_([product_id for product_id, _ in products.values()]))
+    )
+    new_versions = []
+    skipped = 0
+    for product, (source, found) in versions.items():
+        product_id, latest = products[product]
+        latest_key = source.version_key(latest) if latest else None
+        for version, row in found.items():
+            if (product_id, version) in known:
+                continue
+            if latest_key is None or source.version_key(version) > latest_key:
+                skipped += 1
+                continue
+            new_versions.append({'product_id': product_id, 'version': version, 'release_date': row.release_date,
+                                 'full_title': row.title})
+    if new_versions:
+        db.session.execute(insert_ignoring_conflicts(ProductVersion, ['product_id', 'version']), new_versions)
+    if new_products or new_versions:
+        render_cache.bump_catalogue()
+    db.session.commit()
+    return ReplayResult(len(snapshots), failed, len(new_products), len(new_versions), skipped)
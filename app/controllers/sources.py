@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from ..versions import numeric_version_key, version_key
+from .product_updates import (
+    extract_kaspersky, extract_usergate, extract_securitycode,
+    KASPERSKY_PARSE_ONLY, USERGATE_PARSE_ONLY, SECURITYCODE_PARSE_ONLY
+)
+
+# Стратегии сравнения возвращают сортируемые строковые ключи (см. app/versions.py)
+VERSION_KEYS = {
+    'numeric': numeric_version_key,
+    'build': version_key,
+}
+
+
+@dataclass(frozen=True)
+class SourceDefinition:
+    key: str
+    title: str
+    url: str
+    vendor: str
+    extractor: Callable
+    compare: str = 'numeric'
+    # Имя продукта для страниц, описывающих один продукт (changelog UserGate)
+    product: Optional[str] = None
+    verify: bool = True
+    # SoupStrainer с контейнерами, которые нужны извлекателю
+    parse_only: Any = None
+
+    def version_key(self, ver):
+        return VERSION_KEYS[self.compare](ver)
+
+
+# Чтобы добавить вендора, достаточно описать страницу и функцию извлечения строк
+SOURCES = {
+    source.key: source for source in [
+        SourceDefinition(
+            key='kaspersky',
+            title='Kaspersky',
+            url="https://support.kaspersky.ru/corporate/lifecycle?type=limited,full&view=table",
+            vendor="Kaspersky",
+            extractor=extract_kaspersky,
+            parse_only=KASPERSKY_PARSE_ONLY,
+        ),
+        SourceDefinition(
+            key='usergate_ngfw_7',
+            title='UserGate 7.x NGFW',
+            url="https://docs.usergate.com/izmeneniya-v-ngfw-7-243/",
+            vendor="UserGate 7.x",
+            product="NGFW",
+            extractor=extract_usergate,
+            parse_only=USERGATE_PARSE_ONLY,
+            compare='build',
+            verify=False,
+        ),
+        SourceDefinition(
+            key='usergate_management_center_7',
+            title='UserGate 7.x Management Center',
+            url="https://docs.usergate.com/izmeneniya-v-usergate-management-center-7-247/",
+            vendor="UserGate 7.x",
+            product="Management Center",
+            extractor=extract_usergate,
+            parse_only=USERGATE_PARSE_ONLY,
+            compare='build',
+            verify=False,
+        ),
+        SourceDefinition(
+            key='usergate_ngfw_6',
+            title='UserGate 6.x NGFW',
+            url="https://docs.usergate.com/izmeneniya-v-ngfw-6-240/",
+            vendor="UserGate 6.x",
+            product="NGFW",
+            extractor=extract_usergate,
+            parse_only=USERGATE_PARSE_ONLY,
+            compare='build',
+            verify=False,
+        ),
+        SourceDefinition(
+            key='usergate_management_center_6',
+            title='UserGate 6.x Management Center',
+            url="https://docs.usergate.com/izmeneniya-v-usergate-management-center-6-241/",
+            vendor="UserGate 6.x",
+            product="Management Center",
+            extractor=extract_usergate,
+            parse_only=USERGATE_PARSE_ONLY,
+            compare='build',
+            verify=False,
+        ),
+        SourceDefinition(
+            key='securitycode',
+            title='Код Безопасности',
+            url="https://www.securitycode.ru/products/lifecycle/",
+            vendor="Код Безопасности",
+            extractor=extract_securitycode,
+            parse_only=SECURITYCODE_PARSE_ONLY,
+        ),
+    ]
+}
@@ -0,0 +1,115 @@
+import os
+from contextlib import contextmanager
+from sqlalchemy import event, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from . import db
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Произвольный ключ advisory-блокировки PostgreSQL для создания и миграции схемы
+SCHEMA_LOCK_KEY = 7318004
+
+
+def normalize_url(uri):
+    # Heroku-подобные окружения выдают postgres://, SQLAlchemy 2 понимает только postgresql://
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def _is_memory(url):
+    return url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if url.get_backend_name() == 'sqlite':
+        # Пул и check_same_thread для SQLite настраивает Flask-SQLAlchemy
+        return options
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+    return options
+
+
+def sqlite_pragmas(config, url):
+    # WAL позволяет читать во время записи, busy_timeout заставляет ждать снятия блокировки
+    # вместо ошибки "database is locked"; synchronous=NORMAL в режиме WAL безопасен
+    pragmas = [f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}"]
+    if not _is_memory(url):
+        pragmas += [
+            f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+            f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        ]
+    return pragmas
+
+
+def init_app(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        pragmas = sqlite_pragmas(app.config, db.engine.url)
+
+        @event.listens_for(db.engine, 'connect')
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+
+@contextmanager
+def schema_lock():
+    # Воркеры gunicorn стартуют одновременно и каждый вызывает create_all и миграции;
+    # блокировка выполняет эти шаги по очереди, следующий воркер видит уже готовую схему
+    url = db.engine.url
+    if url.get_backend_name() == 'postgresql':
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+            connection.commit()
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': SCHEMA_LOCK_KEY})
+                connection.commit()
+        return
+    if url.get_backend_name() != 'sqlite' or _is_memory(url) or fcntl is None:
+        yield
+        return
+    path = os.path.abspath(url.database) + '.lock'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def dialect_insert(model):
+    # INSERT с поддержкой ON CONFLICT там, где СУБД её умеет (SQLite, PostgreSQL)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    return insert(model)
+
+
+def insert_ignoring_conflicts(model, index_elements):
+    # Строки, нарушающие уникальный индекс index_elements, молча пропускаются
+    statement = dialect_insert(model)
+    if hasattr(statement, 'on_conflict_do_nothing'):
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    return statement
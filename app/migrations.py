@@ -0,0 +1,176 @@
+import secrets
+from sqlalchemy import bindparam, delete, func, inspect, select, text, update
+from . import db
+from .models import User, Product, UserProduct, ProductVersion, AuditItem, Notification, SchemaVersion, CacheStamp
+from .versions import version_key
+
+# db.create_all() создаёт только отсутствующие таблицы и не изменяет существующие, поэтому
+# изменения схемы старой базы выполняются миграциями. Номер применённой миграции хранится
+# в schema_version; каждая миграция идемпотентна, так что на новой базе, уже созданной
+# по моделям, она ничего не меняет.
+
+# Столбцы с сортируемым ключом версии и строка, из которой он вычисляется.
+VERSION_KEY_COLUMNS = [
+    (Product.__table__, 'latest_version', 'latest_version_key'),
+    (UserProduct.__table__, 'accepted_version', 'accepted_version_key'),
+    (ProductVersion.__table__, 'version', 'version_key'),
+    (AuditItem.__table__, 'user_version', 'user_version_key'),
+]
+
+
+def _add_columns(connection, table, column_names):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+    for column_name in column_names:
+        if column_name in existing:
+            continue
+        column = table.c[column_name]
+        ddl = f"{preparer.quote(column_name)} {column.type.compile(dialect=connection.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        connection.execute(text(f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {ddl}"))
+
+
+def _add_missing_columns(connection):
+    for table, _, key_column in VERSION_KEY_COLUMNS:
+        _add_columns(connection, table, [key_column])
+        # Уникальные индексы таблицы создаёт следующая миграция, после удаления дублей
+        for index in table.indexes:
+            if list(index.columns.keys()) == [key_column]:
+                index.create(connection, checkfirst=True)
+
+
+def backfill_version_keys(connection):
+    for table, source_column, key_column in VERSION_KEY_COLUMNS:
+        rows = connection.execute(
+            select(table.c.id, table.c[source_column])
+            .where(table.c[key_column].is_(None), table.c[source_column].isnot(None))
+        ).all()
+        params = [{'_id': row_id, '_key': version_key(value)} for row_id, value in rows]
+        params = [param for param in params if param['_key'] is not None]
+        if params:
+            connection.execute(
+                update(table).where(table.c.id == bindparam('_id')).values({key_column: bindparam('_key')}),
+                params
+            )
+
+
+def add_version_keys(connection):
+    _add_missing_columns(connection)
+    backfill_version_keys(connection)
+
+
+def _create_indexes(connection, names):
+    # Индексы создаются по имени: модели описывают итоговую схему, а миграция — только свой шаг
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def _merge_duplicate_products(connection):
+    # Ссылки на дубли продукта переводятся на запись с наименьшим id, дубли удаляются
+    product = Product.__table__
+    groups = connection.execute(
+        select(product.c.vendor, product.c.name, func.min(product.c.id))
+        .group_by(product.c.vendor, product.c.name)
+        .having(func.count() > 1)
+    ).all()
+    if not groups:
+        return
+    canonical = {(vendor, name): keep_id for vendor, name, keep_id in groups}
+    rows = connection.execute(
+        select(product.c.id, product.c.vendor, product.c.name)
+        .where(product.c.vendor.in_(list({vendor for vendor, _ in canonical})))
+    ).all()
+    moves = [{'_old': row_id, '_new': canonical[(vendor, name)]}
+             for row_id, vendor, name in rows
+             if (vendor, name) in canonical and row_id != canonical[(vendor, name)]]
+    for table in (UserProduct.__table__, ProductVersion.__table__, AuditItem.__table__):
+        connection.execute(
+            update(table).where(table.c.product_id == bindparam('_old')).values(product_id=bindparam('_new')),
+            moves
+        )
+    connection.execute(delete(product).where(product.c.id.in_([move['_old'] for move in moves])))
+
+
+def _delete_duplicates(connection, table, columns, keep):
+    kept = select(keep(table.c.id)).group_by(*(table.c[column] for column in columns))
+    connection.execute(delete(table).where(table.c.id.not_in(kept)))
+
+
+def add_unique_indexes(connection):
+    _merge_duplicate_products(connection)
+    # Для пользователя остаётся последняя принятая версия, для версии продукта — первая запись
+    _delete_duplicates(connection, UserProduct.__table__, ('user_id', 'product_id'), func.max)
+    _delete_duplicates(connection, ProductVersion.__table__, ('product_id', 'version'), func.min)
+    _create_indexes(connection, [
+        'uq_product_vendor_name', 'uq_user_product_user_product', 'uq_product_version_product_version',
+        'ix_notification_user_read', 'ix_audit_item_user_product',
+    ])
+
+
+def add_notification_targets(connection):
+    _add_columns(connection, User.__table__, ['notify_digest'])
+    _add_columns(connection, Notification.__table__, ['product_id', 'version'])
+    _create_indexes(connection, ['uq_notification_user_product_version'])
+
+
+def add_unread_counters(connection):
+    from .controllers.notifications import recount_unread
+    _add_columns(connection, User.__table__, ['unread_notifications'])
+    recount_unread(connection)
+
+
+def add_cache_stamps(connection):
+    # Начальный номер каталога случаен: кэш фрагментов, оставшийся от другой или пересозданной
+    # базы, не совпадёт по ключам с новой
+    stamps = CacheStamp.__table__
+    if connection.execute(select(stamps.c.name).where(stamps.c.name == 'catalogue')).first() is None:
+        connection.execute(stamps.insert().values(name='catalogue', value=secrets.randbelow(2 ** 30)))
+
+
+def add_product_baselines(connection):
+    # Раньше без записи пользователя принятой считалась последняя версия, поэтому она и становится
+    # базовой; записи, совпадающие с базовой версией, больше ничего не добавляют и удаляются
+    product = Product.__table__
+    user_product = UserProduct.__table__
+    _add_columns(connection, product, ['baseline_version', 'baseline_version_key'])
+    connection.execute(
+        update(product).where(product.c.baseline_version.is_(None))
+        .values(baseline_version=product.c.latest_version, baseline_version_key=product.c.latest_version_key)
+    )
+    baseline = select(product.c.baseline_version).where(product.c.id == user_product.c.product_id) \
+        .scalar_subquery()
+    connection.execute(delete(user_product).where(user_product.c.accepted_version == baseline))
+
+
+def add_source_fingerprints(connection):
+    # Пустой отпечаток не совпадает ни с одним: первое обновление заполнит его для всех продуктов
+    _add_columns(connection, Product.__table__, ['source_fingerprint'])
+
+
+MIGRATIONS = [
+    (1, 'version keys', add_version_keys),
+    (2, 'unique and composite indexes', add_unique_indexes),
+    (3, 'notification targets and digest', add_notification_targets),
+    (4, 'unread notification counters', add_unread_counters),
+    (5, 'render cache stamps', add_cache_stamps),
+    (6, 'sparse acceptances', add_product_baselines),
+    (7, 'source fingerprints', add_source_fingerprints),
+]
+
+
+def current_version(connection):
+    return connection.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def upgrade():
+    # Вызывается под database.schema_lock(), поэтому параллельные воркеры не применяют миграции дважды
+    schema_version = SchemaVersion.__table__
+    with db.engine.begin() as connection:
+        applied = current_version(connection)
+        for number, name, migrate in MIGRATIONS:
+            if number <= applied:
+                continue
+            migrate(connection)
+            connection.execute(schema_version.insert().values(version=number, name=name))
@@ -1,6 +1,16 @@
 import datetime
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from . import db
+from .versions import version_key
+
+
+def _version_key_default(column):
+    # Ключ для вставок через insert(): при работе через ORM его выставляют @validates
+    def default(context):
+        return version_key(context.get_current_parameters().get(column))
+    return default
+
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,39 +20,148 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(100))
     profession = db.Column(db.String(100))
     notify = db.Column(db.Boolean, default=True)
+    # Сводка: все изменения одного обновления приходят одним уведомлением
+    notify_digest = db.Column(db.Boolean, default=False)
+    # Число непрочитанных уведомлений: меняется вместе с уведомлениями, а не считается на каждой странице
+    unread_notifications = db.Column(db.Integer, default=0, nullable=False, server_default='0')
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('uq_product_vendor_name', 'vendor', 'name', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     vendor = db.Column(db.String(100), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     latest_version = db.Column(db.String(50))
+    latest_version_key = db.Column(db.String(80), index=True, default=_version_key_default('latest_version'))
+    # Версия, принятая всеми пользователями без своей записи UserProduct: та, с которой продукт
+    # появился в каталоге. Запись UserProduct хранится, только если пользователь принял другую
+    baseline_version = db.Column(db.String(50))
+    baseline_version_key = db.Column(db.String(80), default=_version_key_default('baseline_version'))
     last_updated = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # SHA-1 последней разобранной строки источника: обновление пропускает продукты с тем же отпечатком
+    source_fingerprint = db.Column(db.String(40))
     error = db.Column(db.String(200))
 
+    @validates('latest_version')
+    def _set_latest_version_key(self, key, value):
+        self.latest_version_key = version_key(value)
+        return value
+
+    @validates('baseline_version')
+    def _set_baseline_version_key(self, key, value):
+        self.baseline_version_key = version_key(value)
+        return value
+
 class UserProduct(db.Model):
+    __table_args__ = (
+        db.Index('uq_user_product_user_product', 'user_id', 'product_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     accepted_version = db.Column(db.String(50))
+    accepted_version_key = db.Column(db.String(80), index=True, default=_version_key_default('accepted_version'))
     accepted_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    @validates('accepted_version')
+    def _set_accepted_version_key(self, key, value):
+        self.accepted_version_key = version_key(value)
+        return value
+
 class Notification(db.Model):
+    # Уведомление о версии продукта создаётся один раз на (пользователь, продукт, версия);
+    # у сводки product_id и version пусты, и уникальный индекс её не ограничивает
+    __table_args__ = (
+        db.Index('ix_notification_user_read', 'user_id', 'read'),
+        db.Index('uq_notification_user_product_version', 'user_id', 'product_id', 'version', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    version = db.Column(db.String(50))
     message = db.Column(db.String(255))
     read = db.Column(db.Boolean, default=False)
 
 class ProductVersion(db.Model):
+    __table_args__ = (
+        db.Index('uq_product_version_product_version', 'product_id', 'version', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     version = db.Column(db.String(50), nullable=False)
+    version_key = db.Column(db.String(80), index=True, default=_version_key_default('version'))
     release_date = db.Column(db.String(50))
     full_title = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    @validates('version')
+    def _set_version_key(self, key, value):
+        self.version_key = version_key(value)
+        return value
+
 class AuditItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_audit_item_user_product', 'user_id', 'product_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     user_version = db.Column(db.String(50), nullable=False)
+    user_version_key = db.Column(db.String(80), index=True, default=_version_key_default('user_version'))
     added_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    @validates('user_version')
+    def _set_user_version_key(self, key, value):
+        self.user_version_key = version_key(value)
+        return value
+
+class HttpCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(300), unique=True, nullable=False)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    body_hash = db.Column(db.String(64))
+    checked_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class JobLease(db.Model):
+    # Слот периодической задачи: строку атомарно забирает один процесс на интервал
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    next_run_at = db.Column(db.DateTime, nullable=False)
+
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False, index=True)
+    trigger = db.Column(db.String(20))
+    status = db.Column(db.String(20), default='running')
+    started_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)
+    sources = db.Column(db.JSON)
+
+class SchemaVersion(db.Model):
+    # Применённые миграции (см. app/migrations.py)
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class CacheStamp(db.Model):
+    # Номер версии данных для кэша фрагментов: 'catalogue' — продукты и их последние версии,
+    # 'user:<id>' — принятые версии и аудит пользователя
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class Snapshot(db.Model):
+    # Полученная страница источника; тело лежит в архиве (SNAPSHOT_DIR) под своим SHA-256,
+    # поэтому несколько записей могут ссылаться на один файл
+    __table_args__ = (
+        db.Index('ix_snapshot_source_fetched', 'source_key', 'fetched_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(50), nullable=False)
+    url = db.Column(db.String(300), nullable=False)
+    digest = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer)
+    encoding = db.Column(db.String(50))
+    fetched_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
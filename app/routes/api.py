@@ -0,0 +1,117 @@
+import hashlib
+from flask import Blueprint, jsonify, request, current_app, abort, Response
+from flask_login import login_required, current_user
+from app.models import Product, ProductVersion, AuditItem
+from app.controllers import render_cache
+from app.utils import with_accepted_versions
+from app import db
+
+# Версионированный JSON API только для чтения. Строки отдаются массивами в порядке "fields",
+# страницы — по ключу (after=<id последней строки>). ETag строится из номеров версий данных
+# (CacheStamp), поэтому ответ 304 не требует запросов к самим данным.
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PRODUCT_FIELDS = ['id', 'vendor', 'name', 'latest_version', 'last_updated']
+VERSION_FIELDS = ['id', 'version', 'release_date', 'full_title', 'created_at']
+ACCEPTANCE_FIELDS = ['product_id', 'vendor', 'name', 'accepted_version', 'latest_version', 'outdated']
+AUDIT_FIELDS = ['id', 'product_id', 'vendor', 'name', 'user_version', 'latest_version', 'can_update']
+
+def _page_args():
+    page_size = current_app.config['API_PAGE_SIZE']
+    limit = request.args.get('limit', default=page_size, type=int)
+    return request.args.get('after', default=0, type=int), max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+def _vendor_filter(query, column):
+    vendors = request.args.getlist('vendor')
+    return query.filter(column.in_(vendors)) if vendors else query
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def _etag(stamps):
+    # Сильный ETag: адрес с параметрами и номера версий данных, от которых зависит ответ
+    raw = f"{request.full_path}|{'|'.join(map(str, stamps))}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _conditional(user_scoped, build):
+    catalogue, user = render_cache.current_stamps(current_user.id)
+    etag = _etag((catalogue, current_user.id, user) if user_scoped else (catalogue,))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _page(fields, rows, limit, key_index=0):
+    rows = rows[:limit + 1]
+    items = [[_value(value) for value in row] for row in rows[:limit]]
+    return {
+        'fields': fields,
+        'items': items,
+        'next_after': rows[limit - 1][key_index] if len(rows) > limit else None,
+    }
+
+@api_bp.route('/products')
+@login_required
+def products():
+    after, limit = _page_args()
+
+    def build():
+        query = db.session.query(
+            Product.id, Product.vendor, Product.name, Product.latest_version, Product.last_updated
+        ).filter(Product.id > after)
+        rows = _vendor_filter(query, Product.vendor).order_by(Product.id).limit(limit + 1).all()
+        return _page(PRODUCT_FIELDS, rows, limit)
+    return _conditional(False, build)
+
+@api_bp.route('/products/<int:product_id>/versions')
+@login_required
+def product_versions(product_id):
+    after, limit = _page_args()
+
+    def build():
+        if db.session.get(Product, product_id) is None:
+            abort(404)
+        rows = db.session.query(
+            ProductVersion.id, ProductVersion.version, ProductVersion.release_date,
+            ProductVersion.full_title, ProductVersion.created_at
+        ).filter(ProductVersion.product_id == product_id, ProductVersion.id > after) \
+            .order_by(ProductVersion.id).limit(limit + 1).all()
+        return dict(_page(VERSION_FIELDS, rows, limit), product_id=product_id)
+    return _conditional(False, build)
+
+@api_bp.route('/acceptances')
+@login_required
+def acceptances():
+    after, limit = _page_args()
+    user_id = current_user.id
+
+    def build():
+        query = with_accepted_versions(
+            db.session.query(Product.id, Product.vendor, Product.name, Product.latest_version), user_id
+        ).filter(Product.id > after)
+        rows = _vendor_filter(query, Product.vendor).order_by(Product.id).limit(limit + 1).all()
+        items = []
+        for product_id, vendor, name, latest, accepted, _, outdated in rows:
+            items.append((product_id, vendor, name, accepted, latest, bool(outdated)))
+        return _page(ACCEPTANCE_FIELDS, items, limit)
+    return _conditional(True, build)
+
+@api_bp.route('/audit')
+@login_required
+def audit_status():
+    after, limit = _page_args()
+    user_id = current_user.id
+
+    def build():
+        query = db.session.query(
+            AuditItem.id, Product.id, Product.vendor, Product.name, AuditItem.user_version, Product.latest_version,
+            (AuditItem.user_version_key < Product.latest_version_key).label('can_update')
+        ).join(Product, Product.id == AuditItem.product_id) \
+            .filter(AuditItem.user_id == user_id, AuditItem.id > after)
+        rows = _vendor_filter(query, Product.vendor).order_by(AuditItem.id).limit(limit + 1).all()
+        rows = [row[:-1] + (bool(row[-1]),) for row in rows]
+        return _page(AUDIT_FIELDS, rows, limit)
+    return _conditional(True, build)
@@ -1,14 +1,33 @@
-import csv
-from io import StringIO
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, render_template
+import tempfile
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, render_template, \
+    stream_with_context, current_app
 from flask_login import login_required, current_user
-from packaging import version
 from app.models import AuditItem, Product
 from app import db
-from app.controllers.product_updates import parse_version_with_annotation
+from app.controllers.audit_import import ImportFormatError, read_inventory, import_inventory
+from app.controllers import audit_export, render_cache
+from markupsafe import Markup
 
 audit_bp = Blueprint('audit', __name__)
 
+def _export_rows(user_id):
+    return audit_export.export_rows(user_id, current_app.config['AUDIT_EXPORT_CHUNK_SIZE'])
+
+def _grouped_audit_items(user_id):
+    rows = audit_export.audit_query(user_id).order_by(AuditItem.id)
+    grouped = {}
+    for audit_id, vendor, product_name, user_version, latest_version, can_update in rows:
+        if vendor not in grouped:
+            grouped[vendor] = []
+        grouped[vendor].append({
+            'audit_id': audit_id,
+            'product_name': product_name,
+            'user_version': user_version,
+            'latest_version': latest_version,
+            'can_update': bool(can_update)
+        })
+    return grouped
+
 @audit_bp.route('/audit', methods=['GET', 'POST'])
 @login_required
 def audit():
@@ -20,6 +39,7 @@ def audit():
             if product:
                 audit_item = AuditItem(user_id=current_user.id, product_id=product.id, user_version=user_version)
                 db.session.add(audit_item)
+                render_cache.bump_user(current_user.id)
                 db.session.commit()
                 flash('Устройство добавлено в аудит.', 'success')
             else:
@@ -28,33 +48,47 @@ def audit():
             flash('Заполните все поля.', 'warning')
         return redirect(url_for('audit.audit'))
     else:
-        audit_items = AuditItem.query.filter_by(user_id=current_user.id).all()
-        grouped = {}
-        for item in audit_items:
-            product = db.session.get(Product, item.product_id)
-            if product.vendor not in grouped:
-                grouped[product.vendor] = []
-            try:
-                current_v = version.parse(item.user_version)
-                latest_v = version.parse(product.latest_version) if product.latest_version else None
-            except Exception:
-                current_v = None
-                latest_v = None
-            can_update = current_v and latest_v and current_v < latest_v
-            grouped[product.vendor].append({
-                'audit_id': item.id,
-                'product_name': product.name,
-                'user_version': item.user_version,
-                'latest_version': product.latest_version,
-                'can_update': can_update
-            })
-        products = Product.query.all()
-        return render_template('audit.html', grouped=grouped, products=products)
+        user_id = current_user.id
+        stamps = render_cache.current_stamps(user_id)
+        vendor_tables = render_cache.cached_fragment(
+            'audit', lambda: render_template('audit_tables.html', grouped=_grouped_audit_items(user_id)),
+            user_id=user_id, stamps=stamps)
+        # Список продуктов одинаков для всех пользователей и зависит только от каталога
+        product_options = render_cache.cached_fragment(
+            'audit-products', lambda: render_template('audit_product_options.html', products=Product.query.all()),
+            stamps=stamps)
+        return render_template('audit.html', vendor_tables=Markup(vendor_tables),
+                               product_options=Markup(product_options))
+
+@audit_bp.route('/audit/import', methods=['POST'])
+@login_required
+def import_audit():
+    upload = request.files.get('inventory')
+    if not upload or not upload.filename:
+        flash('Выберите файл для импорта.', 'warning')
+        return redirect(url_for('audit.audit'))
+    try:
+        rows = read_inventory(upload.stream, upload.filename)
+        result = import_inventory(current_user.id, rows, current_app.config['AUDIT_IMPORT_BATCH_SIZE'])
+    except ImportFormatError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('audit.audit'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Ошибка импорта: {str(e)}', 'danger')
+        return redirect(url_for('audit.audit'))
+    flash(f'Импортировано устройств: {result.imported} (устарели: {result.outdated}, '
+          f'актуальны: {result.current}), пропущено строк: {result.skipped}.',
+          'success' if result.imported else 'warning')
+    if result.unmatched:
+        flash('Не найдены продукты: ' + ', '.join(result.unmatched), 'info')
+    return redirect(url_for('audit.audit'))
 
 @audit_bp.route('/audit/clear', methods=['POST'])
 @login_required
 def clear_audit():
     AuditItem.query.filter_by(user_id=current_user.id).delete()
+    render_cache.bump_user(current_user.id)
     db.session.commit()
     flash('Таблица аудита очищена.', 'success')
     return redirect(url_for('audit.audit'))
@@ -62,66 +96,30 @@ def clear_audit():
 @audit_bp.route('/audit/export/csv')
 @login_required
 def export_audit_csv():
-    audit_items = AuditItem.query.filter_by(user_id=current_user.id).all()
-    grouped = {}
-    for item in audit_items:
-        product = db.session.get(Product, item.product_id)
-        if product.vendor not in grouped:
-            grouped[product.vendor] = []
-        try:
-            current_v, _ = parse_version_with_annotation(item.user_version)
-            latest_v, _ = parse_version_with_annotation(product.latest_version) if product.latest_version else (
-            None, None)
-        except Exception:
-            current_v = None
-            latest_v = None
-        needs_update = current_v and latest_v and current_v < latest_v
-        grouped[product.vendor].append({
-            'product_name': product.name,
-            'user_version': item.user_version,
-            'latest_version': product.latest_version,
-            'needs_update': needs_update
-        })
-
-    output = StringIO()
-    output.write('\ufeff')
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-    for vendor, items in grouped.items():
-        writer.writerow([f"Vendor: {vendor}"])
-        writer.writerow(['Устройство', 'Ваша версия', 'Актуальная версия', 'Needs Update'])
-        for item in items:
-            user_version_text = f'="{item["user_version"]}"'
-            latest_version_text = f'="{item["latest_version"]}"' if item["latest_version"] else ""
-            needs_update_text = "Yes" if item["needs_update"] else "No"
-            writer.writerow([item["product_name"], user_version_text, latest_version_text, needs_update_text])
-        writer.writerow([])  # пустая строка между группами
-    output.seek(0)
-    return Response(output.getvalue(), mimetype="text/csv",
+    rows = _export_rows(current_user.id)
+    return Response(stream_with_context(audit_export.csv_chunks(rows)), mimetype="text/csv",
                     headers={"Content-Disposition": "attachment;filename=audit.csv"})
 
 @audit_bp.route('/audit/export/html')
 @login_required
 def export_audit_html():
-    audit_items = AuditItem.query.filter_by(user_id=current_user.id).all()
-    grouped = {}
-    for item in audit_items:
-        product = db.session.get(Product, item.product_id)
-        if product.vendor not in grouped:
-            grouped[product.vendor] = []
-        try:
-            current_v = version.parse(item.user_version)
-            latest_v = version.parse(product.latest_version) if product.latest_version else None
-        except Exception:
-            current_v = None
-            latest_v = None
-        can_update = current_v and latest_v and current_v < latest_v
-        grouped[product.vendor].append({
-            'product_name': product.name,
-            'user_version': item.user_version,
-            'latest_version': product.latest_version,
-            'can_update': can_update
-        })
-    rendered = render_template('audit_export.html', grouped=grouped)
-    return Response(rendered, mimetype="text/html",
+    return Response(audit_export.html_chunks(_export_rows(current_user.id)), mimetype="text/html",
                     headers={"Content-Disposition": "attachment;filename=audit.html"})
+
+@audit_bp.route('/audit/export/xlsx')
+@login_required
+def export_audit_xlsx():
+    output = tempfile.TemporaryFile()
+    audit_export.write_xlsx(_export_rows(current_user.id), output)
+    output.seek(0)
+
+    def generate():
+        with output:
+            while True:
+                chunk = output.read(audit_export.BUFFER_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(generate(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    headers={"Content-Disposition": "attachment;filename=audit.xlsx"})
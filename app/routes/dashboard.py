@@ -1,51 +1,90 @@
-import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
-from app.models import Product, Notification
-from app.utils import get_user_product
+from app.models import Product
+from markupsafe import Markup
+from app.utils import accept_latest_version, accept_latest_versions, with_accepted_versions
+from app.controllers import render_cache
 from app import db
 
 dashboard_bp = Blueprint('dashboard', __name__, template_folder='../../templates')
 
+def _grouped_products(user_id):
+    rows = with_accepted_versions(
+        db.session.query(Product.id, Product.vendor, Product.name, Product.latest_version), user_id
+    ).order_by(Product.id)
+    grouped_products = {}
+    for product_id, vendor, name, latest_version, accepted_version, _, outdated in rows:
+        if vendor not in grouped_products:
+            grouped_products[vendor] = []
+        grouped_products[vendor].append({
+            'id': product_id,
+            'name': name,
+            'accepted_version': accepted_version,
+            'latest_version': latest_version,
+            'outdated': bool(outdated)
+        })
+    return grouped_products
+
 @dashboard_bp.route('/')
 @dashboard_bp.route('/dashboard')
 @login_required
 def dashboard():
-    products = Product.query.all()
-    grouped_products = {}
-    for prod in products:
-        user_prod = get_user_product(current_user.id, prod)
-        if prod.vendor not in grouped_products:
-            grouped_products[prod.vendor] = []
-        grouped_products[prod.vendor].append({
-            'id': prod.id,
-            'name': prod.name,
-            'accepted_version': user_prod.accepted_version,
-            'latest_version': prod.latest_version
-        })
-    notifications = Notification.query.filter_by(user_id=current_user.id, read=False).all()
-    return render_template('dashboard.html', grouped_products=grouped_products, notifications=notifications)
+    user_id = current_user.id
+    vendor_tables = render_cache.cached_fragment(
+        'dashboard',
+        lambda: render_template('dashboard_tables.html', grouped_products=_grouped_products(user_id)),
+        user_id=user_id)
+    return render_template('dashboard.html', vendor_tables=Markup(vendor_tables),
+                           refresh_job=request.args.get('job', type=int))
 
 @dashboard_bp.route('/apply/<int:product_id>', methods=['POST'])
 @login_required
 def apply_change(product_id):
     product = Product.query.get_or_404(product_id)
-    user_prod = get_user_product(current_user.id, product)
-    if product.latest_version and product.latest_version != user_prod.accepted_version:
-        user_prod.accepted_version = product.latest_version
-        user_prod.accepted_at = datetime.datetime.utcnow()
+    if accept_latest_version(current_user.id, product):
+        render_cache.bump_user(current_user.id)
         db.session.commit()
         flash(f'Изменения приняты для {product.vendor} {product.name}.', 'success')
     else:
         flash('Нет новых изменений для применения.', 'info')
     return redirect(url_for('dashboard.dashboard'))
 
-@dashboard_bp.route('/notifications/read', methods=['POST'])
-@login_required
-def mark_notifications_read():
-    notifications = Notification.query.filter_by(user_id=current_user.id, read=False).all()
-    for note in notifications:
-        note.read = True
+def _accept_many(product_ids=None, vendor=None):
+    accepted = accept_latest_versions(current_user.id, product_ids=product_ids, vendor=vendor)
+    if accepted:
+        render_cache.bump_user(current_user.id)
     db.session.commit()
-    flash("Уведомления отмечены как прочитанные.", "success")
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'accepted': accepted})
+    if accepted:
+        flash(f'Изменения приняты для продуктов: {accepted}.', 'success')
+    else:
+        flash('Нет новых изменений для применения.', 'info')
     return redirect(url_for('dashboard.dashboard'))
+
+@dashboard_bp.route('/apply/all', methods=['POST'])
+@login_required
+def apply_all_changes():
+    return _accept_many()
+
+@dashboard_bp.route('/apply/vendor', methods=['POST'])
+@login_required
+def apply_vendor_changes():
+    if request.is_json:
+        vendor = (request.get_json(silent=True) or {}).get('vendor')
+    else:
+        vendor = request.form.get('vendor')
+    if not vendor:
+        abort(400)
+    return _accept_many(vendor=vendor)
+
+@dashboard_bp.route('/apply/selected', methods=['POST'])
+@login_required
+def apply_selected_changes():
+    if request.is_json:
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if not isinstance(ids, list) or not all(isinstance(product_id, int) for product_id in ids):
+            abort(400)
+    else:
+        ids = request.form.getlist('id', type=int)
+    return _accept_many(product_ids=ids)
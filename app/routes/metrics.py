@@ -0,0 +1,13 @@
+import hmac
+from flask import Blueprint, Response, current_app, request, abort
+from app.controllers import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def export_metrics():
+    # Без входа в систему: метрики собирает Prometheus, доступ можно ограничить токеном
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(metrics.registry.collect(), mimetype='text/plain; version=0.0.4; charset=utf-8')
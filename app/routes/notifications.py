@@ -0,0 +1,74 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort
+from flask_login import login_required, current_user
+from app.controllers import notifications as notification_service
+from app import db
+
+notifications_bp = Blueprint('notifications', __name__)
+
+# Куда можно вернуться после отметки уведомлений
+RETURN_ENDPOINTS = ('dashboard.dashboard', 'notifications.list_notifications')
+
+def _wants_json():
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+def _as_dict(note):
+    return {
+        'id': note.id,
+        'message': note.message,
+        'read': bool(note.read),
+        'product_id': note.product_id,
+        'version': note.version,
+    }
+
+@notifications_bp.app_context_processor
+def inject_notifications():
+    # Меню уведомлений в base.html: счётчик хранится у пользователя, список — несколько последних
+    def recent_notifications():
+        if not current_user.is_authenticated:
+            return []
+        items, _ = notification_service.notifications_page(
+            current_user.id, limit=current_app.config['NOTIFICATIONS_MENU_SIZE'], unread_only=True)
+        return items
+    return {'recent_notifications': recent_notifications}
+
+@notifications_bp.route('/notifications')
+@login_required
+def list_notifications():
+    page_size = current_app.config['NOTIFICATIONS_PAGE_SIZE']
+    limit = max(1, min(request.args.get('limit', default=page_size, type=int), page_size * 4))
+    before = request.args.get('before', type=int)
+    unread_only = request.args.get('unread') == '1'
+    items, next_before = notification_service.notifications_page(current_user.id, before, limit, unread_only)
+    if _wants_json():
+        return jsonify({
+            'items': [_as_dict(note) for note in items],
+            'next_before': next_before,
+            'unread_count': current_user.unread_notifications,
+        })
+    return render_template('notifications.html', items=items, next_before=next_before, unread_only=unread_only,
+                           limit=limit)
+
+@notifications_bp.route('/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    # Все непрочитанные отмечаются только по явному all=1; пустой выбор ничего не отмечает
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        if payload.get('all') is True:
+            ids = None
+        else:
+            ids = payload.get('ids')
+            if not isinstance(ids, list) or not all(isinstance(note_id, int) for note_id in ids):
+                abort(400)
+    else:
+        ids = None if request.form.get('all') == '1' else request.form.getlist('id', type=int)
+    marked = notification_service.mark_read(current_user, ids)
+    db.session.commit()
+    if request.is_json or _wants_json():
+        return jsonify({'marked': marked, 'unread_count': current_user.unread_notifications})
+    if marked:
+        flash("Уведомления отмечены как прочитанные.", "success")
+    else:
+        flash("Нет непрочитанных уведомлений для отметки.", "info")
+    endpoint = request.form.get('next')
+    return redirect(url_for(endpoint if endpoint in RETURN_ENDPOINTS else 'dashboard.dashboard'))
@@ -11,6 +11,7 @@ def profile():
         current_user.full_name = request.form.get('full_name')
         current_user.profession = request.form.get('profession')
         current_user.notify = (request.form.get('notify') == 'on')
+        current_user.notify_digest = (request.form.get('notify_digest') == 'on')
         db.session.commit()
         flash('Настройки профиля обновлены.', 'success')
     return render_template('profile.html', user=current_user)
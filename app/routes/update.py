@@ -1,47 +1,67 @@
-from flask import Blueprint, flash, redirect, url_for
+from flask import Blueprint, flash, redirect, url_for, jsonify, request, current_app, abort
 from flask_login import login_required
-from app.controllers import product_updates
+from app.models import JobRun
+from app.controllers import jobs
+from app import db
 
 update_bp = Blueprint('update', __name__)
 
+def _enqueue(keys=None):
+    # Сбор выполняется в фоне: запрос только ставит задачу и сразу возвращает её номер
+    run, created = jobs.enqueue_refresh(current_app._get_current_object(), keys)
+    if run is None:
+        return jsonify({'error': 'Обновление уже выполняется.'}), 409
+    payload = {
+        'job_id': run.id,
+        'created': created,
+        'status_url': url_for('update.job_status', job_id=run.id)
+    }
+    return jsonify(payload), 202 if created else 200
+
 @update_bp.route('/update_usergate_ngfw_6')
 @login_required
 def update_usergate_ngfw_6():
-    result = product_updates.update_usergate_ngfw_internal_6()
-    return result
+    return _enqueue(['usergate_ngfw_6'])
 
 @update_bp.route('/update_securitycode_internal')
 @login_required
 def update_securitycode_internal():
-    result = product_updates.update_securitycode_internal()
-    return result
+    return _enqueue(['securitycode'])
 
 @update_bp.route('/update_usergate_management_center_6')
 @login_required
 def update_usergate_management_center_6():
-    result = product_updates.update_usergate_management_center_internal_6()
-    return result
+    return _enqueue(['usergate_management_center_6'])
 
 @update_bp.route('/update_usergate_ngfw_7')
 @login_required
 def update_usergate_ngfw_7():
-    result = product_updates.update_usergate_ngfw_internal_7()
-    return result
+    return _enqueue(['usergate_ngfw_7'])
 
 @update_bp.route('/update_usergate_management_center_7')
 @login_required
 def update_usergate_management_center_7():
-    result = product_updates.update_usergate_management_center_internal_7()
-    return result
+    return _enqueue(['usergate_management_center_7'])
 
 @update_bp.route('/update_all_versions')
 @login_required
 def update_all_versions():
-    msg_kaspersky = product_updates.update_kaspersky_internal()
-    msg_ngfw_7 = product_updates.update_usergate_ngfw_internal_7()
-    msg_management_7 = product_updates.update_usergate_management_center_internal_7()
-    msg_ngfw_6 = product_updates.update_usergate_ngfw_internal_6()
-    msg_management_6 = product_updates.update_usergate_management_center_internal_6()
-    msg_securitycode = product_updates.update_securitycode_internal()
-    flash(f"Kaspersky: {msg_kaspersky} | NGFW: {msg_ngfw_6}, {msg_ngfw_7} | Management Center: {msg_management_6}, {msg_management_7} | Security Code: {msg_securitycode}", "success")
-    return redirect(url_for('dashboard.dashboard'))
+    if request.accept_mimetypes.best == 'application/json':
+        return _enqueue()
+    run, created = jobs.enqueue_refresh(current_app._get_current_object())
+    if run is None:
+        flash("Обновление уже выполняется.", "info")
+        return redirect(url_for('dashboard.dashboard'))
+    if created:
+        flash(f"Обновление запущено (задача №{run.id}).", "info")
+    else:
+        flash(f"Обновление уже выполняется (задача №{run.id}).", "info")
+    return redirect(url_for('dashboard.dashboard', job=run.id))
+
+@update_bp.route('/update/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    run = db.session.get(JobRun, job_id)
+    if run is None:
+        abort(404)
+    return jsonify(jobs.job_progress(run))
@@ -1,16 +1,74 @@
 import datetime
-from .models import UserProduct
+from sqlalchemy import and_, delete, exists, func, literal, or_, select, update
+from .models import Product, UserProduct
+from .database import insert_ignoring_conflicts
 from . import db
 
-def get_user_product(user_id, product):
-    user_prod = UserProduct.query.filter_by(user_id=user_id, product_id=product.id).first()
-    if not user_prod:
-        user_prod = UserProduct(
-            user_id=user_id,
-            product_id=product.id,
-            accepted_version=product.latest_version,
-            accepted_at=datetime.datetime.utcnow()
-        )
-        db.session.add(user_prod)
-        db.session.commit()
-    return user_prod
+# Принятая пользователем версия: его запись UserProduct, а без неё — базовая версия продукта
+ACCEPTED_VERSION = func.coalesce(UserProduct.accepted_version, Product.baseline_version).label('accepted_version')
+ACCEPTED_KEY = func.coalesce(UserProduct.accepted_version_key, Product.baseline_version_key)
+ACCEPTED_VERSION_KEY = ACCEPTED_KEY.label('accepted_version_key')
+
+
+def older_than(accepted_key, latest_key):
+    # Единое правило "продукт устарел" по индексируемым ключам версий (как у аудита)
+    return accepted_key < latest_key
+
+
+OUTDATED = older_than(ACCEPTED_KEY, Product.latest_version_key).label('outdated')
+
+
+def with_accepted_versions(query, user_id):
+    # Добавляет к запросу по Product принятую версию, её ключ и признак устаревания;
+    # user_id — значение или столбец User.id
+    return query.outerjoin(UserProduct, and_(UserProduct.product_id == Product.id, UserProduct.user_id == user_id)) \
+        .add_columns(ACCEPTED_VERSION, ACCEPTED_VERSION_KEY, OUTDATED)
+
+
+def accept_latest_versions(user_id, product_ids=None, vendor=None):
+    # Принимает последние версии выбранных продуктов (по умолчанию всех) тремя запросами
+    # независимо от их числа и возвращает, у скольких продуктов принятая версия изменилась.
+    # Меняются только устаревшие по older_than продукты, то есть те, что видны устаревшими
+    # на дашборде и в API. Совпадающая с базовой версия не хранится: такие записи пользователя
+    # удаляются, остальные обновляются или создаются.
+    products = Product.__table__
+    user_products = UserProduct.__table__
+    chosen = [products.c.latest_version.isnot(None)]
+    if product_ids is not None:
+        chosen.append(products.c.id.in_(list(product_ids)))
+    if vendor is not None:
+        chosen.append(products.c.vendor == vendor)
+    at_baseline = products.c.latest_version == products.c.baseline_version
+    moved = or_(products.c.baseline_version.is_(None), products.c.latest_version != products.c.baseline_version)
+    own = user_products.c.user_id == user_id
+    latest = select(products.c.latest_version).where(products.c.id == user_products.c.product_id) \
+        .scalar_subquery()
+    latest_key = select(products.c.latest_version_key).where(products.c.id == user_products.c.product_id) \
+        .scalar_subquery()
+    outdated = older_than(user_products.c.accepted_version_key, latest_key)
+    now = datetime.datetime.utcnow()
+
+    removed = db.session.execute(
+        delete(user_products).where(
+            own, outdated, user_products.c.product_id.in_(select(products.c.id).where(at_baseline, *chosen)))
+    ).rowcount
+    updated = db.session.execute(
+        update(user_products).where(
+            own, outdated, user_products.c.product_id.in_(select(products.c.id).where(moved, *chosen)))
+        .values(accepted_version=latest, accepted_version_key=latest_key, accepted_at=now)
+    ).rowcount
+    # Продукты без записи пользователя, у которых базовая версия старше последней
+    missing = select(products.c.id, products.c.latest_version, products.c.latest_version_key) \
+        .add_columns(literal(user_id), literal(now)) \
+        .where(older_than(products.c.baseline_version_key, products.c.latest_version_key), *chosen,
+               ~exists().where(own, user_products.c.product_id == products.c.id))
+    inserted = db.session.execute(
+        insert_ignoring_conflicts(UserProduct, ['user_id', 'product_id']).from_select(
+            ['product_id', 'accepted_version', 'accepted_version_key', 'user_id', 'accepted_at'], missing)
+    ).rowcount
+    return removed + updated + inserted
+
+
+def accept_latest_version(user_id, product):
+    # True, если принятая версия изменилась
+    return accept_latest_versions(user_id, product_ids=[product.id]) > 0
@@ -0,0 +1,56 @@
+import re
+from functools import lru_cache
+from packaging import version
+
+NUMERIC_RE = re.compile(r'(\d+(?:\.\d+)+)')
+BUILD_RE = re.compile(r'build\s+(\d+(\.\d+)+)', re.IGNORECASE)
+# Ширина одного компонента в сортируемом ключе: 10 цифр покрывают номера сборок любых вендоров
+KEY_PART_WIDTH = 10
+
+
+@lru_cache(maxsize=4096)
+def parse_version_with_annotation(ver):
+    # Ищем первую последовательность вида 1.2.3... в строке
+    match = NUMERIC_RE.search(ver)
+    if match:
+        numeric_part = match.group(1)
+        annotation = ver[match.end():].strip()  # Остальная часть строки
+        return version.parse(numeric_part), annotation
+    else:
+        raise ValueError(f"Неверный формат версии: {ver}")
+
+
+@lru_cache(maxsize=4096)
+def extract_build_number(ver_str):
+    m = BUILD_RE.search(ver_str)
+    if m:
+        return m.group(1)
+    return None
+
+
+def _sortable(numeric):
+    # "7.1.0" -> "0000000007.0000000001": строки с таким ключом сравниваются так же,
+    # как версии, поэтому их можно сравнивать и сортировать прямо в SQL
+    parts = [min(int(part), 10 ** KEY_PART_WIDTH - 1) for part in numeric.split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return '.'.join(str(part).zfill(KEY_PART_WIDTH) for part in parts)
+
+
+@lru_cache(maxsize=8192)
+def numeric_version_key(ver):
+    if not ver:
+        return None
+    match = NUMERIC_RE.search(ver)
+    return _sortable(match.group(1)) if match else None
+
+
+@lru_cache(maxsize=8192)
+def version_key(ver):
+    # Номер сборки ("7.1.1 build 7.1.1.1200R") точнее первой числовой последовательности
+    if not ver:
+        return None
+    build = extract_build_number(ver)
+    if build:
+        return _sortable(build)
+    return numeric_version_key(ver)
@@ -0,0 +1,134 @@
+# Сравнение прежнего и нового разбора страниц источников на сохранённых страницах.
+# Проверяет, что результаты совпадают, и печатает время разбора.
+#
+#   python -m benchmarks.bench_extract [--scale 50] [--repeat 5]
+import argparse
+import re
+import time
+from pathlib import Path
+from bs4 import BeautifulSoup
+from packaging import version
+from app.controllers.product_updates import parse_page
+from app.controllers.refresh import _latest_rows
+from app.controllers.sources import SOURCES
+from app.versions import parse_version_with_annotation
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+# Страница и повторяемый фрагмент, которым страница раздувается до размеров реальной
+PAGES = {
+    'kaspersky': ('kaspersky.html', r'<div class="product-gantt__list-item">.*?</div></div></div>'),
+    'usergate_ngfw_7': ('usergate_ngfw_7.html', r'<section class="changelog">.*?</section>'),
+    'securitycode': ('securitycode.html', r'<tr class="common-table__row-non-rwd">.*?</tr>'),
+}
+
+
+def legacy_kaspersky(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    latest = {}
+    for block in soup.select("div.product-gantt__list-items > div.product-gantt__list-item"):
+        title_tag = block.select_one("div.product-gantt__list-item-title")
+        version_tag = block.select_one("div.product-gantt__list-item-version")
+        if not (title_tag and version_tag):
+            continue
+        name, ver = title_tag.get_text(strip=True), version_tag.get_text(strip=True)
+        if ver in ["—", "", None]:
+            continue
+        try:
+            current, _ = parse_version_with_annotation(ver)
+        except Exception:
+            continue
+        if name not in latest or parse_version_with_annotation(latest[name])[0] < current:
+            latest[name] = ver
+    return latest
+
+
+def legacy_usergate(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    valid = []
+    for tag in soup.find_all("skip-glossary"):
+        full_text = tag.get_text(strip=True)
+        status_block = tag.find_next("div", class_="textBlock")
+        if not status_block or "Стабильно" not in status_block.get_text(strip=True):
+            continue
+        m = re.search(r'build\s+(\d+(\.\d+)+)', full_text, re.IGNORECASE) or re.search(r'(\d+(\.\d+)+)', full_text)
+        if m:
+            valid.append((m.group(1), full_text))
+    if not valid:
+        return {}
+    return {'NGFW': max(valid, key=lambda v: version.parse(v[0]))[1]}
+
+
+def legacy_securitycode(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    container = soup.select_one("body > div.container > div.inside-container > div > div:nth-child(5)")
+    latest = {}
+    for row in container.find_all("tr", class_="common-table__row-non-rwd"):
+        cells = row.find_all("td", class_="common-table__cell-non-rwd")
+        if len(cells) < 3:
+            continue
+        name, ver = cells[0].get_text(strip=True), cells[1].get_text(strip=True)
+        if ver in ["—", "", None]:
+            continue
+        try:
+            current, _ = parse_version_with_annotation(ver)
+        except Exception:
+            continue
+        if name not in latest or parse_version_with_annotation(latest[name])[0] < current:
+            latest[name] = ver
+    return latest
+
+
+LEGACY = {
+    'kaspersky': legacy_kaspersky,
+    'usergate_ngfw_7': legacy_usergate,
+    'securitycode': legacy_securitycode,
+}
+
+
+def current(key, html, parser):
+    source = SOURCES[key]
+    rows = source.extractor(parse_page(html, parser, source.parse_only))
+    return {name: row.version for name, row in _latest_rows(source, rows).items()}
+
+
+def load_page(key, scale=1):
+    filename, fragment = PAGES[key]
+    html = (FIXTURES / filename).read_text(encoding='utf-8')
+    if scale > 1:
+        pattern = re.compile(fragment, re.S)
+        html = pattern.sub(lambda m: m.group(0) * scale, html)
+    return html
+
+
+def _timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=int, default=50, help='Во сколько раз раздуть страницу.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'source':<18} {'KiB':>7} {'legacy, s':>10} {'html.parser, s':>15} {'lxml, s':>9} {'match':>6}")
+    for key in PAGES:
+        html = load_page(key, args.scale)
+        expected, legacy_time = _timed(lambda: LEGACY[key](html), args.repeat)
+        builtin, builtin_time = _timed(lambda: current(key, html, 'html.parser'), args.repeat)
+        fast, lxml_time = _timed(lambda: current(key, html, 'lxml'), args.repeat)
+        match = expected == builtin == fast
+        print(f"{key:<18} {len(html.encode()) / 1024:>7.0f} {legacy_time:>10.3f} {builtin_time:>15.3f} "
+              f"{lxml_time:>9.3f} {'yes' if match else 'NO':>6}")
+        if not match:
+            print('  legacy:', expected)
+            print('  current:', fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Замер рассылки уведомлений: число SQL-запросов растёт только на пачки вставки
+# с RETURNING (по 1000 строк), а не на запрос для каждого пользователя.
+#
+#   python -m benchmarks.bench_fanout
+import time
+from sqlalchemy import event, insert
+from app import create_app, db
+from app.config import Config
+from app.models import User, Product, UserProduct, Notification
+from app.controllers import notifications
+from app.versions import numeric_version_key
+
+PRODUCTS = 50
+USER_COUNTS = (100, 1000, 5000)
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def _seed(users):
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'password': '-', 'notify': True} for i in range(users)
+    ])
+    db.session.execute(insert(Product), [
+        {'vendor': 'Bench', 'name': f'product{i}', 'latest_version': '1.0.0', 'baseline_version': '1.0.0'}
+        for i in range(PRODUCTS)
+    ])
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    product_ids = [product_id for (product_id,) in db.session.query(Product.id)]
+    # Каждый четвёртый пользователь уже принял новую версию и уведомления не получит,
+    # для остальных действует базовая версия продуктов
+    db.session.execute(insert(UserProduct), [
+        {'user_id': user_id, 'product_id': product_id, 'accepted_version': '1.1.0'}
+        for user_id in user_ids[::4] for product_id in product_ids
+    ])
+    db.session.commit()
+    return product_ids
+
+
+def run(users):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        product_ids = _seed(users)
+        changes = [
+            notifications.VersionChange(product_id, 'Bench', f'product{i}', '1.1.0', numeric_version_key)
+            for i, product_id in enumerate(product_ids)
+        ]
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        started = time.perf_counter()
+        created = notifications.fan_out(changes)
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert created == Notification.query.count()
+        db.drop_all()
+    return len(statements), created, elapsed
+
+
+def main():
+    print(f"{'users':>8} {'queries':>8} {'notifications':>14} {'seconds':>9}")
+    for users in USER_COUNTS:
+        queries, created, elapsed = run(users)
+        print(f"{users:>8} {queries:>8} {created:>14} {elapsed:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Полный набор замеров без сети: разбор сохранённых страниц источников, обновление
+# (разбор, сравнение и сохранение), дашборд, аудит, выгрузки и рассылка уведомлений
+# на синтетической БД. Для каждого сценария печатает время, число SQL-запросов и пик памяти.
+#
+#   python -m benchmarks.bench_suite                       # 1k пользователей, 5k продуктов, 100k аудита, 1M уведомлений
+#   python -m benchmarks.bench_suite --users 100 --products 500 --audit-items 5000 --notifications 20000
+#
+# Сгенерированная БД сохраняется в --data-dir и переиспользуется следующими запусками;
+# каждый прогон работает на её свежей копии.
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from app import db
+from app.controllers import notifications
+from app.controllers.product_updates import parse_page
+from app.controllers.refresh import refresh_sources, _latest_rows
+from app.controllers.sources import SOURCES
+from app.models import Product
+from .harness import bench_app, fixture_path, install_replay_client, measure, print_measurements
+from .synthetic import DatasetSize, generate, BENCH_USER, BENCH_PASSWORD
+
+FANOUT_PRODUCTS = 50
+
+
+def prepare_dataset(size, data_dir):
+    template = Path(data_dir) / f'vercheck-bench-{size.label}.db'
+    if template.exists():
+        return template
+    partial = template.with_suffix('.partial')
+    if partial.exists():
+        partial.unlink()
+    started = time.perf_counter()
+    app = bench_app(partial)
+    with app.app_context():
+        generate(size)
+        db.engine.dispose()
+    partial.rename(template)
+    print(f'Сгенерирована БД {template} за {time.perf_counter() - started:.1f} с')
+    return template
+
+
+def _parse_scenario(key, parser):
+    source = SOURCES[key]
+    html = fixture_path(key).read_text(encoding='utf-8')
+
+    def run():
+        rows = source.extractor(parse_page(html, parser, source.parse_only))
+        assert _latest_rows(source, rows), key
+    return run
+
+
+def _fan_out_scenario():
+    products = Product.query.order_by(Product.id).limit(FANOUT_PRODUCTS).all()
+    changes = [
+        notifications.VersionChange(p.id, p.vendor, p.name, p.latest_version + '.1',
+                                    SOURCES['kaspersky'].version_key)
+        for p in products
+    ]
+
+    def run():
+        notifications.fan_out(changes)
+        db.session.commit()
+    return run
+
+
+def _get(client, url):
+    # Ответ читается по частям и не накапливается, как при отдаче клиенту
+    def run():
+        response = client.get(url, buffered=False)
+        assert response.status_code == 200, (url, response.status_code)
+        for _ in response.iter_encoded():
+            pass
+        response.close()
+    return run
+
+
+def run_suite(database_path, trace_memory):
+    app = bench_app(database_path)
+    replay = install_replay_client()
+    results = []
+    with app.app_context():
+        engine = db.engine
+
+    def bench(name, func, app_context=True):
+        # HTTP-сценарии выполняются без внешнего app_context: иначе запросы тестового клиента
+        # разделяют его (и g с загруженным пользователем) и делают меньше запросов, чем в работе
+        def run():
+            if not app_context:
+                return func()
+            with app.app_context():
+                return func()
+        results.append(measure(name, run, engine, trace_memory))
+
+    parser = app.config['HTML_PARSER']
+    for key in SOURCES:
+        bench(f'parse {key}', _parse_scenario(key, parser))
+
+    bench('refresh: первая загрузка', refresh_sources)
+    bench('refresh: страницы не изменились (304)', refresh_sources)
+    replay.touch()
+    bench('refresh: новое тело, данные прежние', refresh_sources)
+
+    client = app.test_client()
+    client.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    for url in ('/dashboard', '/notifications', '/notifications?format=json&unread=1', '/audit',
+                '/audit/export/csv', '/audit/export/html', '/audit/export/xlsx'):
+        bench(f'GET {url}', _get(client, url), app_context=False)
+    # Повторные просмотры берут таблицы из кэша фрагментов
+    for url in ('/dashboard', '/audit'):
+        bench(f'GET {url} (повторно)', _get(client, url), app_context=False)
+
+    with app.app_context():
+        fan_out = _fan_out_scenario()
+    bench(f'fan_out: {FANOUT_PRODUCTS} продуктов', fan_out)
+    bench('POST /notifications/read', lambda: client.post('/notifications/read', data={'all': '1'}), app_context=False)
+    bench('POST /apply/all', lambda: client.post('/apply/all'), app_context=False)
+    engine.dispose()
+    return results
+
+
+def main():
+    defaults = DatasetSize()
+    parser = argparse.ArgumentParser(description='Замеры горячих путей VerCheck без сети.')
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--products', type=int, default=defaults.products)
+    parser.add_argument('--audit-items', type=int, default=defaults.audit_items)
+    parser.add_argument('--notifications', type=int, default=defaults.notifications)
+    parser.add_argument('--data-dir', default=tempfile.gettempdir(),
+                        help='Каталог для сгенерированной БД.')
+    parser.add_argument('--no-memory', action='store_true', help='Не снимать пик памяти (прогон вдвое быстрее).')
+    args = parser.parse_args()
+
+    size = DatasetSize(args.users, args.products, args.audit_items, args.notifications)
+    template = prepare_dataset(size, args.data_dir)
+    with tempfile.TemporaryDirectory() as work_dir:
+        work = Path(work_dir) / 'bench.db'
+        shutil.copyfile(template, work)
+        timings = run_suite(work, trace_memory=False)
+        if not args.no_memory:
+            shutil.copyfile(template, work)
+            for timing, traced in zip(timings, run_suite(work, trace_memory=True)):
+                timing.peak_kib = traced.peak_kib
+    print(f'Набор данных: {size.label}')
+    print_measurements(timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Общие средства замеров: конфигурация приложения на отдельной БД, воспроизведение
+# сохранённых страниц вместо сети и замер времени, числа SQL-запросов и пика памяти.
+import hashlib
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+import requests
+from requests.structures import CaseInsensitiveDict
+from sqlalchemy import event
+from app import create_app
+from app.config import Config
+from app.controllers import http_client
+from app.controllers.sources import SOURCES
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def fixture_path(key):
+    return FIXTURES / f'{key}.html'
+
+
+def bench_app(database_path):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{database_path}'
+        RENDER_CACHE_PATH = f'{database_path}.render-cache'
+        SNAPSHOT_DIR = f'{database_path}.snapshots'
+        TESTING = True
+    return create_app(BenchConfig)
+
+
+class ReplayClient:
+    # Подменяет http_client.client: отдаёт сохранённые страницы источников и отвечает 304
+    # на условный запрос с текущим ETag, как это делают сайты вендоров
+    def __init__(self):
+        self.revision = 0
+        self.requests = 0
+        self._pages = {source.url: fixture_path(key).read_bytes() for key, source in SOURCES.items()}
+
+    def touch(self):
+        # Меняет тело и ETag всех страниц, не меняя данных: обновление пройдёт полный разбор и сравнение
+        self.revision += 1
+
+    def _body(self, url):
+        body = self._pages[url]
+        return body + f'<!-- revision {self.revision} -->'.encode() if self.revision else body
+
+    def get(self, url, headers=None, timeout=None, verify=True):
+        self.requests += 1
+        body = self._body(url)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        response = requests.Response()
+        response.url = url
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8', 'ETag': etag})
+        if (headers or {}).get('If-None-Match') == etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = body
+        return response
+
+    def close(self):
+        pass
+
+
+def install_replay_client():
+    http_client.client.close()
+    http_client.client = ReplayClient()
+    return http_client.client
+
+
+@dataclass
+class Measurement:
+    name: str
+    seconds: float
+    queries: int
+    peak_kib: float = None
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def measure(name, func, engine, trace_memory=False):
+    # tracemalloc заметно замедляет Python-код, поэтому время и память снимаются в разных прогонах
+    with QueryCounter(engine) as counter:
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            func()
+            elapsed = time.perf_counter() - started
+        finally:
+            peak = None
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] / 1024
+                tracemalloc.stop()
+    return Measurement(name, elapsed, counter.count, peak)
+
+
+def print_measurements(measurements):
+    print(f"{'scenario':<40} {'seconds':>9} {'queries':>8} {'peak, KiB':>10}")
+    for m in measurements:
+        peak = f'{m.peak_kib:>10.0f}' if m.peak_kib is not None else f"{'-':>10}"
+        print(f'{m.name:<40} {m.seconds:>9.3f} {m.queries:>8} {peak}')
@@ -0,0 +1,80 @@
+# Генерация синтетической БД заданного размера пачечными вставками.
+# Все записи аудита принадлежат замеряемому пользователю, чтобы страница аудита и выгрузки
+# работали на полном объёме; уведомления распределены по всем пользователям.
+from dataclasses import dataclass
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Product, ProductVersion, UserProduct, AuditItem, Notification
+from app.controllers.notifications import recount_unread
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench'
+VENDORS = 50
+BATCH_SIZE = 20000
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    users: int = 1000
+    products: int = 5000
+    audit_items: int = 100000
+    notifications: int = 1000000
+
+    @property
+    def label(self):
+        return f'u{self.users}-p{self.products}-a{self.audit_items}-n{self.notifications}'
+
+
+def _insert(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+def _version(i):
+    return f'{1 + i % 5}.{i % 10}.{i % 7}.{100 + i % 900}'
+
+
+def generate(size):
+    password = generate_password_hash(BENCH_PASSWORD)
+    _insert(User, (
+        {'username': BENCH_USER if i == 0 else f'user{i}', 'password': password, 'notify': i % 4 != 0}
+        for i in range(size.users)
+    ))
+    _insert(Product, (
+        {'vendor': f'Vendor {i % VENDORS:02d}', 'name': f'Product {i}', 'latest_version': _version(i),
+         'baseline_version': _version(i)}
+        for i in range(size.products)
+    ))
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    product_ids = [product_id for (product_id,) in db.session.query(Product.id).order_by(Product.id)]
+    bench_user_id = db.session.query(User.id).filter_by(username=BENCH_USER).scalar()
+
+    _insert(ProductVersion, (
+        {'product_id': product_id, 'version': _version(i), 'full_title': f'Product {i} {_version(i)}'}
+        for i, product_id in enumerate(product_ids)
+    ))
+    # Замеряемый пользователь принял старые версии половины продуктов, для остальных действует базовая
+    _insert(UserProduct, (
+        {'user_id': bench_user_id, 'product_id': product_id, 'accepted_version': '1.0.0'}
+        for product_id in product_ids[::2]
+    ))
+    _insert(AuditItem, (
+        {'user_id': bench_user_id, 'product_id': product_ids[i % len(product_ids)],
+         'user_version': _version(i + 3)}
+        for i in range(size.audit_items)
+    ))
+    _insert(Notification, (
+        {'user_id': user_ids[i % len(user_ids)], 'message': f'Новая версия для Vendor {i % VENDORS:02d} '
+                                                            f'Product {i % size.products}: {_version(i)}',
+         'read': i % 3 != 0}
+        for i in range(size.notifications)
+    ))
+    recount_unread()
+    db.session.commit()
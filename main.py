@@ -1,6 +1,8 @@
 from app import create_app
+from app.controllers import scheduler
 
 app = create_app()
+scheduler.init_app(app)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0')
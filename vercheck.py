@@ -0,0 +1,8 @@
+# Служебные команды без веб-сервера и планировщика, для cron и CI:
+#   python vercheck.py refresh --source kaspersky --parallel 4 --json
+#   python vercheck.py export-audit audit.xlsx --user admin
+# То же доступно как flask --app app vercheck ... (main.py, в отличие от них, запускает и планировщик).
+from app.cli import main
+
+if __name__ == '__main__':
+    main()